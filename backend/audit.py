@@ -0,0 +1,65 @@
+"""Field-level audit trail of work order changes.
+
+Each update is compared as pre- and post-image and the changed fields are
+recorded with their old and new values. Part and process lists are compared
+per item (keyed by ``part_id`` / ``process_id``), so selecting one part is
+logged as ``parts.<part_id>.selected`` instead of the whole list.
+"""
+import uuid
+from datetime import datetime
+from typing import Any, List, Optional
+
+AUDIT_COLLECTION = "work_order_audit"
+
+# Bookkeeping fields that change with every update or follow from other fields
+IGNORED_FIELDS = {"_id", "updated_at", "status_changed_at", "reserved_part_ids", "revision"}
+
+# Lists of sub-documents that are compared item by item
+ITEM_KEYS = {"parts": "part_id", "processes": "process_id"}
+
+
+def _diff_value(path: str, old: Any, new: Any, changes: List[dict]):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new)):
+            _diff_value(f"{path}.{key}", old.get(key), new.get(key), changes)
+        return
+    changes.append({"field": path, "old": old, "new": new})
+
+
+def _diff_items(path: str, key: str, old: List[dict], new: List[dict], changes: List[dict]):
+    old_items = {item.get(key): item for item in old or []}
+    new_items = {item.get(key): item for item in new or []}
+    for item_id in [*old_items, *(i for i in new_items if i not in old_items)]:
+        _diff_value(f"{path}.{item_id}", old_items.get(item_id), new_items.get(item_id), changes)
+
+
+def diff(before: dict, after: dict) -> List[dict]:
+    """``[{"field", "old", "new"}, ...]`` for every field that differs"""
+    changes: List[dict] = []
+    for field in [*before, *(f for f in after if f not in before)]:
+        if field in IGNORED_FIELDS:
+            continue
+        if field in ITEM_KEYS:
+            _diff_items(field, ITEM_KEYS[field], before.get(field), after.get(field), changes)
+        else:
+            _diff_value(field, before.get(field), after.get(field), changes)
+    return changes
+
+
+def audit_entry(
+    work_order_id: str,
+    shop_id: str,
+    changes: List[dict],
+    actor: Optional[str],
+    changed_at: datetime,
+) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "work_order_id": work_order_id,
+        "shop_id": shop_id,
+        "actor": actor or "ismeretlen",
+        "changed_at": changed_at,
+        "changes": changes,
+    }
@@ -0,0 +1,229 @@
+"""Cross-process invalidation for the in-process caches of the Turbo API."""
+import asyncio
+import inspect
+import logging
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Broadcasts cache invalidation events between worker processes.
+
+    Events are appended to a small capped collection that every worker tails.
+    Each worker applies the events published by the *other* workers to its
+    local caches through the handlers registered with ``subscribe``; the
+    publishing worker is expected to have applied the change itself already.
+
+    A re-created cursor resumes in natural (insertion) order after the last
+    event it saw; ObjectIds of different processes are not ordered within a
+    second, so they cannot be used as a position. When that event has been
+    overwritten in the meantime, later ones may be lost as well, and the
+    handlers registered with ``on_resync`` rebuild the caches from the
+    database.
+    """
+
+    def __init__(
+        self,
+        collection_name: str = "cache_invalidations",
+        size_bytes: int = 1024 * 1024,
+        max_events: int = 10000,
+        retry_interval: float = 1.0,
+    ):
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.max_events = max_events
+        self.retry_interval = retry_interval
+        self.worker_id = uuid.uuid4().hex
+        self.received = 0
+        self.resyncs = 0
+        self.publish_failures = 0
+        self._handlers: Dict[str, List[Callable[[Any], Any]]] = {}
+        self._resync_handlers: List[Callable[[], Any]] = []
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, topic: str, handler: Callable[[Any], Any]):
+        """Register ``handler(payload)`` for events published on ``topic``"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def on_resync(self, handler: Callable[[], Any]):
+        """Register ``handler()`` to rebuild local caches after events were lost"""
+        self._resync_handlers.append(handler)
+
+    async def start(self, db):
+        try:
+            await db.create_collection(
+                self.collection_name, capped=True, size=self.size_bytes, max=self.max_events
+            )
+        except (CollectionInvalid, OperationFailure):
+            pass  # Already created by another worker
+        self._collection = db[self.collection_name]
+
+        # Only events published from now on are relevant, older ones are
+        # already reflected in whatever this worker loads from the database.
+        latest = await self._collection.find({}, {"_id": 1}).sort("$natural", -1).to_list(1)
+        last_id = latest[0]["_id"] if latest else None
+        self._task = asyncio.create_task(self._tail(last_id))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, topic: str, payload: Any = None):
+        """Send an event to the other workers.
+
+        Runs after the write it describes has been committed, so a failure
+        is logged rather than raised; the other workers' result caches then
+        expire through ``max_age``.
+        """
+        if self._collection is None:
+            return
+        try:
+            await self._collection.insert_one({
+                "topic": topic,
+                "payload": payload,
+                "origin": self.worker_id,
+                "created_at": datetime.utcnow()
+            })
+        except PyMongoError as exc:
+            self.publish_failures += 1
+            logger.error("Cache invalidation event %s not published: %s", topic, exc)
+
+    async def _tail(self, last_id):
+        while True:
+            # Events up to and including ``seek`` were handled already
+            seek = last_id
+            try:
+                cursor = self._collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        last_id = event["_id"]
+                        if seek is not None:
+                            if last_id == seek:
+                                seek = None
+                            continue
+                        if event.get("origin") != self.worker_id:
+                            await self._dispatch(event)
+                    if seek is not None:
+                        # Caught up without meeting the last event seen: it was
+                        # overwritten, possibly together with unseen ones
+                        seek = None
+                        await self._resync()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as exc:
+                logger.warning("Cache invalidation cursor failed: %s", exc)
+            # A tailable cursor on an empty capped collection dies right away
+            await asyncio.sleep(self.retry_interval)
+
+    async def _resync(self):
+        self.resyncs += 1
+        logger.warning("Cache invalidation events may have been lost, resyncing caches")
+        for handler in self._resync_handlers:
+            try:
+                result = handler()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Cache resync handler failed")
+
+    async def _dispatch(self, event: dict):
+        self.received += 1
+        for handler in self._handlers.get(event.get("topic"), []):
+            try:
+                result = handler(event.get("payload"))
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Cache invalidation handler failed for %s", event.get("topic"))
+
+
+class WriteVersions:
+    """Per-collection write counters of this worker.
+
+    Every write bumps the versions of the collections it touched, locally and
+    (through the invalidation bus) in the other workers. A cached result is
+    valid as long as the versions it was computed at are still current.
+    """
+
+    def __init__(self):
+        self._versions: Counter = Counter()
+
+    def bump(self, *collections: str):
+        for collection in collections:
+            self._versions[collection] += 1
+
+    def snapshot(self, collections: Iterable[str]) -> tuple:
+        return tuple(self._versions[collection] for collection in collections)
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self._versions)
+
+
+class ResultCache:
+    """Bounded LRU of query results invalidated by ``WriteVersions``.
+
+    Versions are read *before* computing a result, so a write that lands
+    while the query runs makes the stored entry stale right away. ``max_age``
+    bounds staleness when a bus event from another worker is late or lost.
+    """
+
+    def __init__(self, versions: WriteVersions, max_entries: int = 256, max_age: float = 60.0):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        depends_on: Iterable[str],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        snapshot = self.versions.snapshot(depends_on)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == snapshot and now - entry[1] < self.max_age:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        value = await compute()
+        self._entries[key] = (snapshot, now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "versions": self.versions.to_dict(),
+        }
@@ -0,0 +1,173 @@
+"""MongoDB client configuration, connection pool metrics and warm-up.
+
+The client is configured from the environment (pool bounds, wire
+compression, timeouts, read preference of report queries). At startup the
+pool is filled to its minimum size before the instance reports ready, so
+the first requests after a deploy do not pay for connection setup, and pool
+checkouts are counted so waits and exhaustion under bursts show up in
+``PoolMetrics`` instead of only as request latency.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+from profiling import CommandProfiler
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def database_name() -> str:
+    return os.environ.get('TURBO_DB_NAME', 'turbo_service_db')
+
+
+def compressors() -> List[str]:
+    """Wire compressors to offer; zstd and snappy only when their package is installed"""
+    configured = os.environ.get('MONGO_COMPRESSORS')
+    if configured is not None:
+        return [name.strip() for name in configured.split(',') if name.strip()]
+    available = []
+    for name, module in (("zstd", "zstandard"), ("snappy", "snappy")):
+        try:
+            __import__(module)
+            available.append(name)
+        except ImportError:
+            pass
+    return available + ["zlib"]
+
+
+def report_read_preference():
+    """Read preference of report and analytics queries, ``secondaryPreferred`` by default.
+
+    Work order lists stay on the primary: their cache is keyed on write
+    versions, so a lagging secondary would cache a result as current.
+    """
+    name = os.environ.get('MONGO_REPORT_READ_PREFERENCE', 'secondaryPreferred')
+    max_staleness = _int_env('MONGO_REPORT_MAX_STALENESS_SECONDS', -1)
+    return make_read_preference(read_pref_mode_from_name(name), None, max_staleness=max_staleness)
+
+
+def for_reports(collection):
+    """Collection handle that reads with the report read preference"""
+    return collection.with_options(read_preference=report_read_preference())
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters and checkout wait times, across all servers.
+
+    Checkout start and end are reported on the same (executor) thread, so
+    the wait is measured with a thread-local start time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.pool_clears = 0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def connection_check_out_failed(self, event):
+        reason = str(event.reason)
+        with self._lock:
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+
+def create_client(pool_metrics: Optional[PoolMetrics] = None) -> AsyncIOMotorClient:
+    """Motor client configured from the environment; connects lazily"""
+    listeners = [CommandProfiler()]
+    if pool_metrics is not None:
+        listeners.append(pool_metrics)
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        minPoolSize=_int_env('MONGO_MIN_POOL_SIZE', 10),
+        maxPoolSize=_int_env('MONGO_MAX_POOL_SIZE', 100),
+        maxIdleTimeMS=_int_env('MONGO_MAX_IDLE_TIME_MS', 300000),
+        # Requests fail fast with a pool timeout instead of queueing indefinitely
+        waitQueueTimeoutMS=_int_env('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000),
+        connectTimeoutMS=_int_env('MONGO_CONNECT_TIMEOUT_MS', 5000),
+        serverSelectionTimeoutMS=_int_env('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        socketTimeoutMS=_int_env('MONGO_SOCKET_TIMEOUT_MS', 30000),
+        compressors=compressors(),
+        appname=os.environ.get('MONGO_APP_NAME', 'turbo-service'),
+        event_listeners=listeners,
+    )
+
+
+async def warm_up(client: AsyncIOMotorClient) -> int:
+    """Open ``minPoolSize`` connections by pinging concurrently, returns that count"""
+    connections = max(client.options.pool_options.min_pool_size, 1)
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    return connections
+
+
+async def ping(client: AsyncIOMotorClient, timeout: float = 2.0) -> bool:
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,95 @@
+"""Work order calendar dates and the due-date work queues built on them.
+
+``received_date`` and ``estimated_completion`` are calendar days in the API
+but are stored as midnight datetimes: BSON has no date type, and datetimes
+sort, range-filter and index correctly. The queues are plain index range
+scans over ``(status, estimated_completion)`` and ``(status,
+status_changed_at)``, so their cost depends on the size of the queue, not
+of the backlog.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from turnaround import CLOSED_STATUSES, STAGE_FLOW
+
+DATE_FIELDS = ("received_date", "estimated_completion")
+
+# Statuses that still need work, listed so queue filters can use an index
+OPEN_STATUSES = [status for status in STAGE_FLOW if status not in CLOSED_STATUSES]
+
+
+def to_mongo_date(value):
+    """``date`` -> midnight ``datetime``, anything else unchanged"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time())
+    return value
+
+
+def to_mongo_dates(doc: dict) -> dict:
+    """Copy of a work order (or update) dict with its calendar dates storable"""
+    return {k: to_mongo_date(v) if k in DATE_FIELDS else v for k, v in doc.items()}
+
+
+def from_mongo_dates(doc: dict) -> dict:
+    """Stored work order with its calendar dates back as ``date``, for raw responses"""
+    for field in DATE_FIELDS:
+        if isinstance(doc.get(field), datetime):
+            doc[field] = doc[field].date()
+    return doc
+
+
+def shop_today() -> datetime:
+    """Midnight of the current day in the shop's time zone, as stored"""
+    shop_timezone = ZoneInfo(os.environ.get("SHOP_TIMEZONE", "Europe/Budapest"))
+    return datetime.combine(datetime.now(shop_timezone).date(), time())
+
+
+def date_range(start: Optional[date], end: Optional[date]) -> Optional[dict]:
+    """Inclusive calendar range as a query on a stored date field"""
+    query = {}
+    if start:
+        query["$gte"] = to_mongo_date(start)
+    if end:
+        query["$lt"] = to_mongo_date(end) + timedelta(days=1)
+    return query or None
+
+
+def queue_query(queue: str, today: datetime) -> Tuple[Dict, Dict]:
+    """``(filter, sort)`` of a work queue; each matches an index prefix"""
+    if queue == "awaiting_quote":
+        return {"status": "QUOTED"}, {"status_changed_at": 1}
+
+    if queue == "overdue":
+        due = {"$lt": today}
+    elif queue == "due_today":
+        due = {"$gte": today, "$lt": today + timedelta(days=1)}
+    elif queue == "this_week":
+        week_end = today + timedelta(days=7 - today.weekday())
+        due = {"$gte": today, "$lt": week_end}
+    else:
+        raise ValueError(f"unknown work queue: {queue}")
+    return {"status": {"$in": OPEN_STATUSES}, "estimated_completion": due}, {"estimated_completion": 1}
+
+
+async def migrate_date_fields(db) -> int:
+    """Convert calendar dates stored as 'YYYY-MM-DD' strings to datetimes"""
+    converted = 0
+    for field in DATE_FIELDS:
+        result = await db.work_orders.update_many(
+            {field: {"$type": "string"}},
+            [{
+                "$set": {
+                    field: {
+                        "$dateFromString": {
+                            "dateString": {"$substrCP": [f"${field}", 0, 10]},
+                            "format": "%Y-%m-%d",
+                            "onError": None
+                        }
+                    }
+                }
+            }]
+        )
+        converted += result.modified_count
+    return converted
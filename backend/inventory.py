@@ -0,0 +1,98 @@
+"""Parts stock with atomic reservations.
+
+Every turbo part carries ``quantity`` (on the shelf), ``reserved`` (held for
+open work orders) and ``available`` (quantity - reserved). The three are
+only ever changed together by conditional ``$inc`` updates whose filter
+checks the precondition, so concurrent work orders cannot oversell a part
+and no read-modify-write is needed. ``available`` is stored rather than
+computed so low-stock queries can use an index.
+
+A part whose stock has never been counted has ``available`` unset (or
+null). Such parts are outside stock tracking: selecting them reserves
+nothing, until the first ``adjust`` starts tracking them from zero.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+
+class InsufficientStock(Exception):
+    def __init__(self, part_id: str):
+        super().__init__(part_id)
+        self.part_id = part_id
+
+
+# Matches parts whose stock has never been counted
+UNTRACKED = {"available": None}
+
+
+async def reserve(db, part_ids: Iterable[str]) -> List[str]:
+    """Reserve one unit per listed part id, all or nothing.
+
+    Returns the ids actually reserved, i.e. without the untracked parts and
+    parts deleted from the catalog, which are skipped.
+    """
+    reserved: List[str] = []
+    for part_id, count in Counter(part_ids).items():
+        result = await db.turbo_parts.update_one(
+            {"id": part_id, "available": {"$gte": count}},
+            {"$inc": {"reserved": count, "available": -count}}
+        )
+        if result.modified_count == 0:
+            part = await db.turbo_parts.find_one({"id": part_id}, {"_id": 0, "available": 1})
+            if part is None or part.get("available") is None:
+                continue
+            await release(db, reserved)
+            raise InsufficientStock(part_id)
+        reserved.extend([part_id] * count)
+    return reserved
+
+
+async def release(db, part_ids: Iterable[str]):
+    """Give reserved units back to the available stock"""
+    for part_id, count in Counter(part_ids).items():
+        await db.turbo_parts.update_one(
+            {"id": part_id, "reserved": {"$gte": count}},
+            {"$inc": {"reserved": -count, "available": count}}
+        )
+
+
+async def consume(db, part_ids: Iterable[str]):
+    """Take reserved units off the shelf when the order is delivered"""
+    for part_id, count in Counter(part_ids).items():
+        await db.turbo_parts.update_one(
+            {"id": part_id, "reserved": {"$gte": count}, "quantity": {"$gte": count}},
+            {"$inc": {"reserved": -count, "quantity": -count}}
+        )
+
+
+async def adjust(db, part_id: str, delta: int) -> Optional[dict]:
+    """Add or remove shelf stock; never below what is already reserved.
+
+    The first adjustment of an untracked part starts tracking it from
+    zero. Returns the updated part, or None if it does not exist or the
+    removal would eat into reserved units.
+    """
+    await db.turbo_parts.update_one(
+        {"id": part_id, **UNTRACKED},
+        {"$set": {"quantity": 0, "reserved": 0, "available": 0}}
+    )
+    query = {"id": part_id}
+    if delta < 0:
+        query["available"] = {"$gte": -delta}
+    return await db.turbo_parts.find_one_and_update(
+        query,
+        {"$inc": {"quantity": delta, "available": delta}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def reservation_plan(held: List[str], wanted: List[str]):
+    """Part ids to reserve and to release to go from ``held`` to ``wanted``"""
+    held_counts, wanted_counts = Counter(held), Counter(wanted)
+    return (
+        list((wanted_counts - held_counts).elements()),
+        list((held_counts - wanted_counts).elements()),
+    )
@@ -0,0 +1,273 @@
+"""Opt-in per-request profiling for hot-path analysis.
+
+A profiled request records wall-clock spans for every MongoDB command, for
+response model validation and for JSON serialization, plus (optionally) a
+sampled stack profile of the event loop thread. Finished profiles go into a
+bounded ring buffer that admins can read back through the API.
+
+Requests are profiled when they carry ``X-Profile: 1`` (or ``X-Profile:
+stack`` for stack sampling) together with a valid ``X-Admin-Token``, or at
+random with probability ``sample_rate``.
+"""
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MAX_SPANS = 500
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, sample_stacks: bool = False):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.sample_stacks = sample_stacks
+        self.started_at = datetime.utcnow()
+        self.status_code: Optional[int] = None
+        self.wall_seconds = 0.0
+        self.spans: List[dict] = []
+        self.totals: Counter = Counter()
+        self.counts: Counter = Counter()
+        self.stack_samples: Counter = Counter()
+        self.pending_commands: Dict[int, str] = {}
+        self._started = time.perf_counter()
+
+    def add_span(self, kind: str, name: str, start: float, duration: float):
+        self.totals[kind] += duration
+        self.counts[kind] += 1
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append({
+                "kind": kind,
+                "name": name,
+                "start_ms": round((start - self._started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            })
+
+    def finish(self, status_code: Optional[int]):
+        self.status_code = status_code
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        breakdown = {kind: round(seconds * 1000, 3) for kind, seconds in self.totals.items()}
+        # Concurrent DB calls overlap, so "other" is a lower bound
+        breakdown["other"] = round(max(self.wall_seconds - sum(self.totals.values()), 0.0) * 1000, 3)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_seconds * 1000, 3),
+            "breakdown_ms": breakdown,
+            "counts": dict(self.counts),
+            "spans": self.spans,
+            "stacks": [
+                {"stack": stack, "samples": samples}
+                for stack, samples in self.stack_samples.most_common(20)
+            ],
+        }
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """Time a block as part of the current request's profile (no-op when not profiling)"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(kind, name, start, time.perf_counter() - start)
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Attributes MongoDB command timings to the profiled request.
+
+    Motor runs pymongo calls in executor threads with a copy of the caller's
+    context, so the request profile is visible from these callbacks.
+    """
+
+    def started(self, event):
+        profile = _current.get()
+        if profile is not None:
+            target = event.command.get(event.command_name)
+            name = f"{event.command_name} {target}" if isinstance(target, str) else event.command_name
+            profile.pending_commands[event.request_id] = name
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    @staticmethod
+    def _record(event):
+        profile = _current.get()
+        if profile is None:
+            return
+        name = profile.pending_commands.pop(event.request_id, event.command_name)
+        duration = event.duration_micros / 1_000_000
+        profile.add_span("db", name, time.perf_counter() - duration, duration)
+
+
+class StackSampler:
+    """Samples the event loop thread's stack while stack-profiled requests run.
+
+    Requests share the event loop thread, so samples taken while several
+    profiled requests overlap are attributed to each of them.
+    """
+
+    def __init__(self, interval: float = 0.005, depth: int = 12):
+        self.interval = interval
+        self.depth = depth
+        self._targets: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, profile: RequestProfile, thread_id: int):
+        with self._lock:
+            self._targets[profile.id] = (profile, thread_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, profile: RequestProfile):
+        with self._lock:
+            self._targets.pop(profile.id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                targets = list(self._targets.values())
+            frames = sys._current_frames()
+            for profile, thread_id in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stack_samples[self._describe(frame)] += 1
+            time.sleep(self.interval)
+
+    def _describe(self, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.depth:
+            code = frame.f_code
+            parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return " <- ".join(parts)
+
+
+class ProfileStore:
+    """Ring buffer of the most recent finished profiles"""
+
+    def __init__(self, size: int = 200):
+        self._profiles: deque = deque(maxlen=size)
+
+    def add(self, profile: dict):
+        self._profiles.append(profile)
+
+    def list(self, limit: int = 50) -> List[dict]:
+        return list(reversed(self._profiles))[:limit]
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return next((p for p in self._profiles if p["id"] == profile_id), None)
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: ProfileStore,
+        admin_token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        sampler: Optional[StackSampler] = None,
+    ):
+        self.app = app
+        self.store = store
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.sampler = sampler or StackSampler()
+
+    def _requested_mode(self, scope: Scope) -> Optional[str]:
+        headers = Headers(scope=scope)
+        mode = headers.get("x-profile")
+        token = headers.get("x-admin-token")
+        if mode and self.admin_token and token and secrets.compare_digest(
+            token.encode(), self.admin_token.encode()
+        ):
+            return mode
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "1"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        mode = self._requested_mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], sample_stacks=mode == "stack")
+        status_code = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile.id)
+            await send(message)
+
+        token = _current.set(profile)
+        if profile.sample_stacks:
+            self.sampler.attach(profile, threading.get_ident())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profile.sample_stacks:
+                self.sampler.detach(profile)
+            _current.reset(token)
+            profile.finish(status_code)
+            self.store.add(profile.to_dict())
+
+
+def instrument_response_validation() -> Callable[[], None]:
+    """Time FastAPI's response_model validation/encoding as ``validate`` spans.
+
+    Wraps ``fastapi.routing.serialize_response``, the module global FastAPI's
+    request handler calls (as of FastAPI 0.110, pinned in requirements.txt).
+    The wrapper is process-wide but only records inside profiled requests.
+    Returns a function that removes it again.
+    """
+    import fastapi.routing
+
+    original = fastapi.routing.serialize_response
+    if getattr(original, "_profiled", False):
+        return lambda: None
+
+    async def serialize_response(*args, **kwargs):
+        with span("validate", "response_model"):
+            return await original(*args, **kwargs)
+
+    def restore():
+        if fastapi.routing.serialize_response is serialize_response:
+            fastapi.routing.serialize_response = original
+
+    serialize_response._profiled = True
+    fastapi.routing.serialize_response = serialize_response
+    return restore
@@ -0,0 +1,174 @@
+"""Monthly revenue and throughput rollups.
+
+Every work order contributes to a handful of ``monthly_rollups`` documents,
+one per (month, dimension, key):
+
+* ``total``            - order totals (cleaning + reconditioning + turbo price)
+* ``turbo_code``       - order totals and volume per turbo code
+* ``supplier``         - selected parts revenue per supplier
+* ``part_category``    - selected parts revenue per part category
+* ``process_category`` - selected processes revenue per process category
+
+Rollups are kept current incrementally from the before/after images of each
+write, ``rebuild_rollups`` recomputes them from scratch for backfills.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+ROLLUP_COLLECTION = "monthly_rollups"
+PRICE_FIELDS = ["cleaning_price", "reconditioning_price", "turbo_price"]
+ORDER_FIELDS = ["created_at", "turbo_code", "parts", "processes", *PRICE_FIELDS]
+
+RollupKey = Tuple[str, str, str]
+
+
+def month_key(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+
+def rollup_id(month: str, dimension: str, key: str) -> str:
+    return f"{month}|{dimension}|{key}"
+
+
+def order_contributions(work_order: Optional[dict]) -> Dict[RollupKey, List[float]]:
+    """``[revenue, count]`` a single work order adds to each rollup"""
+    rows: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+    if not work_order:
+        return rows
+
+    month = month_key(work_order["created_at"])
+    order_total = sum(work_order.get(field) or 0.0 for field in PRICE_FIELDS)
+    for dimension, key in (("total", ""), ("turbo_code", work_order.get("turbo_code") or "")):
+        rows[(month, dimension, key)][0] += order_total
+        rows[(month, dimension, key)][1] += 1
+
+    for part in work_order.get("parts") or []:
+        if part.get("selected"):
+            for dimension, key in (("supplier", part["supplier"]), ("part_category", part["category"])):
+                rows[(month, dimension, key)][0] += part["price"]
+                rows[(month, dimension, key)][1] += 1
+
+    for process in work_order.get("processes") or []:
+        if process.get("selected"):
+            rows[(month, "process_category", process["category"])][0] += process["price"]
+            rows[(month, "process_category", process["category"])][1] += 1
+    return rows
+
+
+async def apply_order_to_rollups(db, before: Optional[dict], after: Optional[dict]):
+    """Apply the difference between two images of a work order to the rollups"""
+    old, new = order_contributions(before), order_contributions(after)
+    requests = []
+    for key in old.keys() | new.keys():
+        revenue = new.get(key, [0.0, 0])[0] - old.get(key, [0.0, 0])[0]
+        count = new.get(key, [0.0, 0])[1] - old.get(key, [0.0, 0])[1]
+        if not revenue and not count:
+            continue
+        month, dimension, value = key
+        requests.append(UpdateOne(
+            {"_id": rollup_id(*key)},
+            {
+                "$inc": {"revenue": revenue, "count": count},
+                "$setOnInsert": {"month": month, "dimension": dimension, "key": value}
+            },
+            upsert=True
+        ))
+    if requests:
+        await db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False)
+
+
+def _exploded(orders: pd.DataFrame, column: str) -> pd.DataFrame:
+    items = orders[["month", column]].explode(column).dropna(subset=[column])
+    if items.empty:
+        return pd.DataFrame(columns=["month", "category", "price", "selected", "supplier"])
+    details = pd.DataFrame(items[column].tolist(), index=items.index)
+    details["month"] = items["month"]
+    return details[details["selected"].fillna(False).astype(bool)]
+
+
+def rollup_batch(docs: List[dict]) -> pd.DataFrame:
+    """Aggregate a batch of work orders into (month, dimension, key) rows"""
+    orders = pd.DataFrame.from_records(docs, columns=ORDER_FIELDS)
+    orders["month"] = pd.to_datetime(orders["created_at"]).dt.strftime("%Y-%m")
+    order_total = orders[PRICE_FIELDS].fillna(0.0).to_numpy(dtype=np.float64).sum(axis=1)
+
+    frames = [
+        pd.DataFrame({
+            "month": orders["month"], "dimension": "total", "key": "",
+            "revenue": order_total, "count": 1
+        }),
+        pd.DataFrame({
+            "month": orders["month"], "dimension": "turbo_code",
+            "key": orders["turbo_code"].fillna(""), "revenue": order_total, "count": 1
+        }),
+    ]
+
+    parts = _exploded(orders, "parts")
+    for dimension, column in (("supplier", "supplier"), ("part_category", "category")):
+        frames.append(pd.DataFrame({
+            "month": parts["month"], "dimension": dimension, "key": parts[column],
+            "revenue": parts["price"], "count": 1
+        }))
+
+    processes = _exploded(orders, "processes")
+    frames.append(pd.DataFrame({
+        "month": processes["month"], "dimension": "process_category", "key": processes["category"],
+        "revenue": processes["price"], "count": 1
+    }))
+
+    rows = pd.concat([frame for frame in frames if not frame.empty], ignore_index=True)
+    return rows.groupby(["month", "dimension", "key"], sort=False)[["revenue", "count"]].sum()
+
+
+async def rebuild_rollups(db, batch_size: int = 2000) -> int:
+    """Recompute every rollup from the work orders, streaming them in batches.
+
+    Must run while work order writes are quiesced: the rebuilt values are
+    written as absolute ``$set``s after streaming, so an ``$inc`` from
+    ``apply_order_to_rollups`` for an order that was already streamed is
+    overwritten and lost.
+    """
+    totals: Optional[pd.DataFrame] = None
+    projection = {"_id": 0, **{field: 1 for field in ORDER_FIELDS}}
+    cursor = db.work_orders.find({}, projection).batch_size(batch_size)
+
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            totals = _accumulate(totals, rollup_batch(batch))
+            batch = []
+    if batch:
+        totals = _accumulate(totals, rollup_batch(batch))
+
+    collection = db[ROLLUP_COLLECTION]
+    if totals is None:
+        await collection.delete_many({})
+        return 0
+
+    ids = []
+    requests = []
+    for (month, dimension, key), row in totals.iterrows():
+        ids.append(rollup_id(month, dimension, key))
+        requests.append(UpdateOne(
+            {"_id": ids[-1]},
+            {"$set": {
+                "month": month, "dimension": dimension, "key": key,
+                "revenue": float(row["revenue"]), "count": int(row["count"])
+            }},
+            upsert=True
+        ))
+    await collection.bulk_write(requests, ordered=False)
+    await collection.delete_many({"_id": {"$nin": ids}})
+    return len(ids)
+
+
+def _accumulate(totals: Optional[pd.DataFrame], batch: pd.DataFrame) -> pd.DataFrame:
+    if totals is None:
+        return batch
+    return totals.add(batch, fill_value=0)
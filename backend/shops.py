@@ -0,0 +1,91 @@
+"""Service locations (shops) that partition clients, vehicles and work orders.
+
+Every shop-scoped document carries ``shop_id`` and every shop-scoped query
+filters on it with equality, backed by indexes that start with ``shop_id``.
+A shop therefore never scans another shop's data, and ``shop_id`` can later
+become the shard key prefix or be used to route a shop to its own database.
+Catalogs (car makes and models, parts, processes, notes) are shared.
+"""
+import os
+import re
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from audit import AUDIT_COLLECTION
+from turnaround import TRANSITION_COLLECTION
+
+SHOP_COLLECTIONS = ("clients", "vehicles", "work_orders")
+# Per work order history, filtered on the shop of the order it belongs to
+HISTORY_COLLECTIONS = (AUDIT_COLLECTION, TRANSITION_COLLECTION)
+COUNTER_COLLECTION = "counters"
+FIRST_WORK_NUMBER = 40000
+
+SHOP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def default_shop_id() -> str:
+    return os.environ.get("DEFAULT_SHOP_ID", "main")
+
+
+async def highest_work_number(db, shop_id: str) -> int:
+    """Largest numeric work number already used in the shop"""
+    result = await db.work_orders.aggregate([
+        {"$match": {"shop_id": shop_id, "work_number": {"$regex": "^[0-9]+$"}}},
+        {"$addFields": {"num": {"$toInt": "$work_number"}}},
+        {"$sort": {"num": -1}},
+        {"$limit": 1}
+    ]).to_list(1)
+    return result[0]["num"] if result else FIRST_WORK_NUMBER - 1
+
+
+async def next_work_number(db, shop_id: str) -> str:
+    """Atomically take the next work number of the shop's sequence.
+
+    The counter is seeded from the work numbers already in use the first
+    time a shop needs one; ``$max`` makes concurrent seeding harmless.
+    """
+    counters = db[COUNTER_COLLECTION]
+    counter_id = f"work_number:{shop_id}"
+    counter = await counters.find_one_and_update(
+        {"_id": counter_id}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER
+    )
+    if counter is None:
+        highest = await highest_work_number(db, shop_id)
+        try:
+            await counters.update_one({"_id": counter_id}, {"$max": {"seq": highest}}, upsert=True)
+        except DuplicateKeyError:
+            pass  # Seeded by a concurrent request
+        counter = await counters.find_one_and_update(
+            {"_id": counter_id}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER
+        )
+    return str(counter["seq"])
+
+
+async def backfill_shop_ids(db) -> int:
+    """Assign documents written before shops existed to the default shop"""
+    assigned = 0
+    for name in SHOP_COLLECTIONS:
+        result = await db[name].update_many(
+            {"shop_id": {"$exists": False}}, {"$set": {"shop_id": default_shop_id()}}
+        )
+        assigned += result.modified_count
+    return assigned
+
+
+async def backfill_history_shop_ids(db):
+    """Copy the work order's shop onto audit entries and transitions written without one"""
+    for name in HISTORY_COLLECTIONS:
+        await db[name].aggregate([
+            {"$match": {"shop_id": {"$exists": False}}},
+            {"$lookup": {
+                "from": "work_orders",
+                "localField": "work_order_id",
+                "foreignField": "id",
+                "as": "order"
+            }},
+            {"$project": {
+                "shop_id": {"$ifNull": [{"$first": "$order.shop_id"}, default_shop_id()]}
+            }},
+            {"$merge": {"into": name, "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+        ]).to_list(None)
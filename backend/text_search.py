@@ -0,0 +1,95 @@
+"""In-memory inverted index for free-text search over turbo and car notes."""
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+
+# Lower rank sorts first
+SEVERITY_RANK = {"CRITICAL": 0, "WARNING": 1, "INFO": 2}
+TITLE_WEIGHT = 2
+
+
+def fold(text: str) -> str:
+    """Case and diacritic insensitive form: 'Olajellátás ŐRZŐ' -> 'olajellatas orzo'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+class NoteSearchIndex:
+    """Token -> {note key: weighted term frequency} postings over note titles and descriptions.
+
+    Queries match notes containing every token, the last token also matches
+    as a prefix so results follow the user while typing. Hits are ranked by
+    severity (CRITICAL first), then by term frequency, then newest first.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._vocabulary: List[str] = []
+        self._notes: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def clear(self):
+        self._postings.clear()
+        self._vocabulary.clear()
+        self._notes.clear()
+
+    def add(self, note: dict):
+        """Index a note dict; ``kind`` ('turbo' or 'car') and ``id`` identify it"""
+        key = f"{note['kind']}:{note['id']}"
+        if key in self._notes:
+            return
+        self._notes[key] = note
+
+        weights: Dict[str, int] = defaultdict(int)
+        for token in tokenize(note.get("title", "")):
+            weights[token] += TITLE_WEIGHT
+        for token in tokenize(note.get("description", "")):
+            weights[token] += 1
+        for token, weight in weights.items():
+            if token not in self._postings:
+                insort(self._vocabulary, token)
+            self._postings[token][key] = weight
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None) -> List[dict]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        candidates = [self._postings.get(token, {}) for token in tokens[:-1]]
+        candidates.append(self._prefix_postings(tokens[-1]))
+        candidates.sort(key=len)
+
+        scores = dict(candidates[0])
+        for postings in candidates[1:]:
+            if not scores:
+                break
+            scores = {key: score + postings[key] for key, score in scores.items() if key in postings}
+
+        hits = []
+        for key, score in scores.items():
+            note = self._notes[key]
+            if kind and note["kind"] != kind:
+                continue
+            hits.append({**note, "score": score})
+        hits.sort(key=lambda hit: hit["created_at"], reverse=True)
+        hits.sort(key=lambda hit: (SEVERITY_RANK.get(hit["note_type"], len(SEVERITY_RANK)), -hit["score"]))
+        return hits[:limit]
+
+    def _prefix_postings(self, prefix: str) -> Dict[str, int]:
+        merged: Dict[str, int] = {}
+        index = bisect_left(self._vocabulary, prefix)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(prefix):
+            for key, weight in self._postings[self._vocabulary[index]].items():
+                merged[key] = max(merged.get(key, 0), weight)
+            index += 1
+        return merged
@@ -0,0 +1,178 @@
+"""In-memory lookup structures for turbo codes."""
+import heapq
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+_SEPARATORS = re.compile(r"[^0-9A-Z]")
+
+
+def normalize_turbo_code(code: str) -> str:
+    """Case and separator insensitive key: '5490-970-0071' -> '54909700071'"""
+    return _SEPARATORS.sub("", (code or "").upper())
+
+
+class TurboCodeIndex:
+    """Sorted array of normalized turbo codes searched by prefix with bisect.
+
+    Each key keeps one display form of the code and how many work orders
+    used it, which is what suggestions are ranked by.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._entries: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def load(self, codes: Iterable[Tuple[str, int]]):
+        """Replace the index contents with ``(code, count)`` pairs"""
+        self._entries = {}
+        for code, count in codes:
+            self._merge(code, count)
+        self._keys = sorted(self._entries)
+
+    def add(self, code: str, count: int = 1):
+        is_new = normalize_turbo_code(code) not in self._entries
+        key = self._merge(code, count)
+        if key and is_new:
+            insort(self._keys, key)
+
+    def remove(self, code: str, count: int = 1):
+        """Forget ``count`` uses of a code; the code itself stays suggestible"""
+        entry = self._entries.get(normalize_turbo_code(code))
+        if entry:
+            entry["count"] = max(entry["count"] - count, 0)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        key = normalize_turbo_code(prefix)
+        lo = bisect_left(self._keys, key)
+        hi = bisect_left(self._keys, key + "\uffff", lo)
+        best = heapq.nsmallest(
+            limit,
+            self._keys[lo:hi],
+            key=lambda k: (-self._entries[k]["count"], k)
+        )
+        return [
+            {"turbo_code": self._entries[k]["code"], "count": self._entries[k]["count"]}
+            for k in best
+        ]
+
+    def _merge(self, code: str, count: int) -> str:
+        key = normalize_turbo_code(code)
+        if not key:
+            return ""
+        code = code.strip()
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = {"code": code, "count": count}
+        else:
+            entry["count"] += count
+            # Prefer the spelling with separators, it is the one people read
+            if len(code) > len(entry["code"]):
+                entry["code"] = code
+        return key
+
+
+class CompatibilityIndex:
+    """Turbo code <-> vehicle / engine code map.
+
+    Pairs come from two sources: the car model catalog (``common_turbos`` and
+    ``engine_codes``) and combinations observed on historical work orders.
+    Every pair remembers whether it is in the catalog and how often it was
+    observed, results are ranked by those two.
+    """
+
+    def __init__(self):
+        self._vehicles_by_turbo: Dict[str, Dict[Tuple[str, str], dict]] = {}
+        self._engines_by_turbo: Dict[str, Dict[str, dict]] = {}
+        self._turbos_by_engine: Dict[str, Dict[str, dict]] = {}
+        self._display: Dict[str, str] = {}
+
+    def clear(self):
+        self._vehicles_by_turbo.clear()
+        self._engines_by_turbo.clear()
+        self._turbos_by_engine.clear()
+        self._display.clear()
+
+    def add_catalog_model(self, make: str, model: str, engine_codes: Iterable[str], turbo_codes: Iterable[str]):
+        engine_codes = list(engine_codes)
+        for turbo_code in turbo_codes:
+            self._link(turbo_code, make, model, catalog=True)
+            for engine_code in engine_codes:
+                self._link_engine(turbo_code, engine_code, catalog=True)
+
+    def add_observation(self, turbo_code: str, make: str, model: str, engine_code: str, count: int = 1):
+        self._link(turbo_code, make, model, observed=count)
+        self._link_engine(turbo_code, engine_code, observed=count)
+
+    def remove_observation(self, turbo_code: str, make: str, model: str, engine_code: str, count: int = 1):
+        self.add_observation(turbo_code, make, model, engine_code, -count)
+
+    def vehicles_for_turbo(self, turbo_code: str) -> List[dict]:
+        pairs = self._vehicles_by_turbo.get(normalize_turbo_code(turbo_code), {})
+        return self._ranked(
+            {
+                "car_make": stats["make"],
+                "car_model": stats["model"],
+                "in_catalog": stats["in_catalog"],
+                "observed": stats["observed"]
+            }
+            for stats in pairs.values()
+        )
+
+    def engines_for_turbo(self, turbo_code: str) -> List[dict]:
+        return self._ranked_codes(self._engines_by_turbo.get(normalize_turbo_code(turbo_code), {}))
+
+    def turbos_for_engine(self, engine_code: str) -> List[dict]:
+        return self._ranked_codes(self._turbos_by_engine.get(normalize_turbo_code(engine_code), {}))
+
+    def _link(self, turbo_code: str, make: str, model: str, catalog: bool = False, observed: int = 0):
+        turbo_key = self._remember(turbo_code)
+        make, model = (make or "").strip(), (model or "").strip()
+        if not turbo_key or not make or not model:
+            return
+        pairs = self._vehicles_by_turbo.setdefault(turbo_key, {})
+        stats = pairs.setdefault(
+            (make.casefold(), model.casefold()),
+            {"make": make, "model": model, "in_catalog": False, "observed": 0}
+        )
+        self._bump(stats, catalog, observed)
+        if not stats["in_catalog"] and stats["observed"] <= 0:
+            del pairs[(make.casefold(), model.casefold())]
+
+    def _link_engine(self, turbo_code: str, engine_code: str, catalog: bool = False, observed: int = 0):
+        turbo_key = self._remember(turbo_code)
+        engine_key = self._remember(engine_code)
+        if not turbo_key or not engine_key:
+            return
+        for outer, inner, table in (
+            (turbo_key, engine_key, self._engines_by_turbo),
+            (engine_key, turbo_key, self._turbos_by_engine),
+        ):
+            codes = table.setdefault(outer, {})
+            stats = codes.setdefault(inner, {"in_catalog": False, "observed": 0})
+            self._bump(stats, catalog, observed)
+            if not stats["in_catalog"] and stats["observed"] <= 0:
+                del codes[inner]
+
+    def _remember(self, code: str) -> str:
+        key = normalize_turbo_code(code)
+        if key and len(code.strip()) > len(self._display.get(key, "")):
+            self._display[key] = code.strip()
+        return key
+
+    @staticmethod
+    def _bump(stats: dict, catalog: bool, observed: int):
+        stats["in_catalog"] = stats["in_catalog"] or catalog
+        stats["observed"] = max(stats["observed"] + observed, 0)
+
+    @staticmethod
+    def _ranked(rows: Iterable[dict]) -> List[dict]:
+        return sorted(rows, key=lambda row: (-row["observed"], not row["in_catalog"]))
+
+    def _ranked_codes(self, codes: Dict[str, dict]) -> List[dict]:
+        return self._ranked(
+            {"code": self._display[key], **stats} for key, stats in codes.items()
+        )
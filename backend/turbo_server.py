@@ -1,27 +1,117 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import asyncio
 import logging
+import secrets
+from collections import Counter
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Iterable, List, Optional
 import uuid
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from enum import Enum
 
+import audit
+import database
+import due_dates
+import inventory
+import reporting
+import shops
+import turnaround
+import uniqueness
+from caching import InvalidationBus, ResultCache, WriteVersions
+from profiling import (
+    ProfileStore, ProfilingMiddleware, instrument_response_validation
+)
+from responses import CompressionMiddleware, FastJSONResponse
+from text_search import NoteSearchIndex
+from turbo_index import CompatibilityIndex, TurboCodeIndex
+from write_buffer import WriteBehindBuffer
+
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client['turbo_service_db']
+# MongoDB connection, configured from the environment (see database.py)
+pool_metrics = database.PoolMetrics()
+client = database.create_client(pool_metrics)
+db = client[database.database_name()]
+
+# In-memory lookup indexes, loaded on startup and kept current on writes
+turbo_code_index = TurboCodeIndex()
+compatibility_index = CompatibilityIndex()
+note_search_index = NoteSearchIndex()
+
+# Keeps the in-process caches of every uvicorn worker coherent
+invalidation_bus = InvalidationBus()
+
+# Work order list results, valid until one of their collections is written
+write_versions = WriteVersions()
+work_order_list_cache = ResultCache(
+    write_versions,
+    max_entries=int(os.environ.get('WORK_ORDER_CACHE_SIZE', '256')),
+    max_age=float(os.environ.get('WORK_ORDER_CACHE_MAX_AGE', '60'))
+)
+
+# Finished request profiles, see ProfilingMiddleware
+profile_store = ProfileStore(int(os.environ.get('PROFILING_BUFFER_SIZE', '200')))
+
+async def warm_up_pool():
+    connections = await database.warm_up(client)
+    logger.info("Connection pool warmed up with %d connections", connections)
+
+async def prepare_database():
+    """Run the database startup steps in order, retrying a failed step until it succeeds.
+
+    Runs in the background so the process comes up (and /health/live
+    answers) while MongoDB is still unreachable; /health/ready reports 503
+    until every step has completed.
+    """
+    steps = [warm_up_pool, create_indexes, run_migrations, start_invalidation_bus, load_lookup_indexes]
+    for step in steps:
+        delay = 1.0
+        while True:
+            try:
+                await step()
+                break
+            except PyMongoError as exc:
+                logger.warning("Startup step %s failed, retrying in %.0fs: %s", step.__name__, delay, exc)
+            except Exception:
+                logger.exception("Startup step %s failed, retrying in %.0fs", step.__name__, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+    app.state.ready = True
+    logger.info("Database prepared, ready to serve")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work; the database is prepared by ``prepare_database``"""
+    # Patches FastAPI internals (checked against 0.110) only while this app runs
+    remove_validation_spans = instrument_response_validation()
+    # The buffers retry their own inserts, they need no database yet
+    await start_write_buffers()
+    preparation = asyncio.create_task(prepare_database())
+    yield
+    app.state.ready = False
+    preparation.cancel()
+    try:
+        await preparation
+    except asyncio.CancelledError:
+        pass
+    remove_validation_spans()
+    await invalidation_bus.stop()
+    await transition_log.stop()
+    await audit_log.stop()
+    client.close()
 
 # Create the main app
-app = FastAPI(title="Turbó Szerviz Kezelő API")
+app = FastAPI(title="Turbó Szerviz Kezelő API", default_response_class=FastJSONResponse, lifespan=lifespan)
+app.state.ready = False
 api_router = APIRouter(prefix="/api")
 
 
@@ -47,6 +137,19 @@ class NoteType(str, Enum):
     WARNING = "WARNING"
     CRITICAL = "CRITICAL"
 
+class ReportDimension(str, Enum):
+    TOTAL = "total"                         # Munkalap végösszegek
+    TURBO_CODE = "turbo_code"               # Turbó kódonként
+    SUPPLIER = "supplier"                   # Beszállítónként (alkatrészek)
+    PART_CATEGORY = "part_category"         # Alkatrész kategóriánként
+    PROCESS_CATEGORY = "process_category"   # Munkafolyamat kategóriánként
+
+class WorkQueue(str, Enum):
+    OVERDUE = "overdue"                     # Lejárt határidő
+    DUE_TODAY = "due_today"                 # Ma esedékes
+    THIS_WEEK = "this_week"                 # E heti határidő
+    AWAITING_QUOTE = "awaiting_quote"       # Árajánlat elfogadására vár
+
 
 # Car Database Models
 class CarMake(BaseModel):
@@ -111,10 +214,28 @@ class CarNoteCreate(BaseModel):
     title: str
     description: str
 
+class NoteKind(str, Enum):
+    TURBO = "turbo"
+    CAR = "car"
+
+class NoteSearchHit(BaseModel):
+    id: str
+    kind: NoteKind
+    note_type: NoteType
+    title: str
+    description: str
+    turbo_code: Optional[str] = None
+    car_make: Optional[str] = None
+    car_model: Optional[str] = None
+    engine_code: Optional[str] = None
+    created_at: datetime
+    score: int                      # Találatok súlyozott száma
+
 
 # Client Models
 class Client(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    shop_id: str = Field(default_factory=shops.default_shop_id)  # Telephely
     name: str
     phone: str
     email: Optional[str] = ""
@@ -178,6 +299,9 @@ class TurboPart(BaseModel):
     supplier: str
     price: float = 0.0
     in_stock: bool = True
+    quantity: Optional[int] = None  # Raktáron lévő mennyiség, None: még nincs leltározva
+    reserved: int = 0               # Nyitott munkalapokra lefoglalva
+    available: Optional[int] = None  # quantity - reserved
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class TurboPartCreate(BaseModel):
@@ -186,6 +310,10 @@ class TurboPartCreate(BaseModel):
     supplier: str
     price: float = 0.0
     in_stock: bool = True
+    quantity: Optional[int] = None  # Csak létrehozáskor, utána /stock
+
+class StockAdjustment(BaseModel):
+    delta: int                      # Bevételezés (+) vagy selejtezés (-)
 
 class WorkOrderPart(BaseModel):
     part_id: str
@@ -199,6 +327,7 @@ class WorkOrderPart(BaseModel):
 # Vehicle Models
 class Vehicle(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    shop_id: str = Field(default_factory=shops.default_shop_id)  # Telephely
     client_id: str
     make: Optional[str] = ""
     model: Optional[str] = ""
@@ -235,10 +364,13 @@ class WorkOrder(BaseModel):
     
     # Received date
     received_date: date = Field(default_factory=date.today)
+    shop_id: str = Field(default_factory=shops.default_shop_id)  # Telephely
     
     # Parts and processes selection
     parts: List[WorkOrderPart] = []
     processes: List[WorkOrderProcess] = []
+    reserved_part_ids: List[str] = []  # Készletből lefoglalt alkatrészek
+    revision: int = 0               # Minden módosításnál nő, ETag-ként kiadva
     
     # Status checkboxes
     status_passed: bool = False     # OK (PASSED)
@@ -251,6 +383,7 @@ class WorkOrder(BaseModel):
     
     # Workflow
     status: WorkStatus = WorkStatus.RECEIVED
+    status_changed_at: datetime = Field(default_factory=datetime.utcnow)
     quote_sent: bool = False        # OFERTAT
     quote_accepted: bool = False    # ACCEPT
     estimated_completion: Optional[date] = None # TERMEN ESTIMATIV
@@ -295,6 +428,95 @@ class WorkOrderUpdate(BaseModel):
     client_notified: Optional[bool] = None
 
 
+class TurboCodeCount(BaseModel):
+    turbo_code: str
+    count: int
+
+class ClientStats(BaseModel):
+    client_id: str
+    order_count: int = 0
+    total_spend: float = 0.0
+    last_visit: Optional[datetime] = None
+    top_turbo_codes: List[TurboCodeCount] = []
+
+class ClientHistory(BaseModel):
+    client: Client
+    stats: ClientStats
+    orders: List[WorkOrder]
+    next_cursor: Optional[datetime] = None
+
+
+class CompatibleVehicle(BaseModel):
+    car_make: str
+    car_model: str
+    in_catalog: bool = False        # Szerepel a modell katalógusban
+    observed: int = 0               # Ennyi munkalapon fordult elő
+
+class CompatibleCode(BaseModel):
+    code: str
+    in_catalog: bool = False
+    observed: int = 0
+
+class TurboCompatibility(BaseModel):
+    turbo_code: str
+    vehicles: List[CompatibleVehicle]
+    engine_codes: List[CompatibleCode]
+
+class EngineCompatibility(BaseModel):
+    engine_code: str
+    turbo_codes: List[CompatibleCode]
+
+
+class MonthlyRollup(BaseModel):
+    month: str                      # 2024-05
+    dimension: ReportDimension
+    key: str
+    revenue: float = 0.0
+    count: int = 0
+
+
+class StatusTransition(BaseModel):
+    id: str
+    work_order_id: str
+    from_status: WorkStatus
+    to_status: WorkStatus
+    changed_at: datetime
+    duration_seconds: float         # Ennyi ideig volt az előző státuszban
+
+class FieldChange(BaseModel):
+    field: str                      # pl. status, parts.<part_id>.selected
+    old: Optional[Any] = None
+    new: Optional[Any] = None
+
+class AuditEntry(BaseModel):
+    id: str
+    work_order_id: str
+    actor: str                      # X-User fejlécből
+    changed_at: datetime
+    changes: List[FieldChange]
+
+class StageTurnaround(BaseModel):
+    status: WorkStatus
+    count: int = 0                  # Ennyiszer hagyták el ezt a státuszt
+    avg_seconds: Optional[float] = None
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    p95_seconds: Optional[float] = None
+    max_seconds: Optional[float] = None
+    open_count: int = 0             # Jelenleg ebben a státuszban
+    stalled_count: int = 0          # Régebb óta itt, mint a 90. percentilis
+
+class TurnaroundReport(BaseModel):
+    stages: List[StageTurnaround]
+    overdue_count: int              # Lejárt becsült határidő, még nincs kész
+
+class CompletionEstimate(BaseModel):
+    work_order_id: str
+    status: WorkStatus
+    remaining_seconds: float
+    estimated_completion: date
+
+
 class WorkOrderWithDetails(BaseModel):
     id: str
     work_number: str
@@ -310,25 +532,368 @@ class WorkOrderWithDetails(BaseModel):
     has_car_warning: bool = False
     created_at: datetime
 
+class BoardColumn(BaseModel):
+    status: WorkStatus
+    total: int = 0                  # Összes munkalap ebben az oszlopban
+    orders: List[WorkOrderWithDetails] = []
+    next_cursor: Optional[datetime] = None  # "Több betöltése" ettől a created_at-tól
+
+class WorkOrderBoard(BaseModel):
+    columns: List[BoardColumn]
+
+
+# Admin-only endpoints require the X-Admin-Token header to match ADMIN_TOKEN
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token or not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Nincs jogosultság")
+
+
+# Clients, vehicles and work orders belong to the shop named by the
+# X-Shop-Id header (or shop_id parameter); catalogs are shared
+async def current_shop(
+    x_shop_id: Optional[str] = Header(None),
+    shop_id: Optional[str] = Query(None)
+) -> str:
+    shop = x_shop_id or shop_id or shops.default_shop_id()
+    if not shops.SHOP_ID_PATTERN.match(shop):
+        raise HTTPException(status_code=400, detail="Érvénytelen telephely azonosító")
+    return shop
+
+
+# Helper function to build sparse fieldset projections
+def build_projection(model, fields: Optional[str] = None) -> dict:
+    """Translate a comma separated ``fields`` parameter into a Mongo projection.
+
+    Without ``fields`` every model field is projected, so internal keys stored
+    next to the model data never leak into responses. ``id`` is always kept.
+    """
+    if fields:
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested - model.model_fields.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ismeretlen mező(k): {', '.join(sorted(unknown))}"
+            )
+        requested.add("id")
+    else:
+        requested = model.model_fields.keys()
 
-# Helper function to generate work number
-async def generate_work_number() -> str:
-    """Generate next work number based on existing entries"""
-    pipeline = [
-        {"$match": {"work_number": {"$regex": "^[0-9]+$"}}},
-        {"$addFields": {"num": {"$toInt": "$work_number"}}},
-        {"$sort": {"num": -1}},
-        {"$limit": 1}
-    ]
+    projection = {name: 1 for name in requested}
+    projection["_id"] = 0
+    return projection
+
+
+# Helper function to shape work orders into list rows
+def work_order_details_stages(projection: dict) -> List[dict]:
+    """Warning lookups and the final $project producing WorkOrderWithDetails rows.
+
+    Expects the client to be joined as ``client`` already. The note lookups
+    only run when their warning flag is part of the requested projection.
+    """
+    stages = []
     
-    result = await db.work_orders.aggregate(pipeline).to_list(1)
+    # Check for warnings
+    if "has_turbo_warning" in projection:
+        stages.append({
+            "$lookup": {
+                "from": "turbo_notes",
+                "localField": "turbo_code",
+                "foreignField": "turbo_code",
+                "as": "turbo_warnings"
+            }
+        })
     
-    if result:
-        next_num = result[0]["num"] + 1
-    else:
-        next_num = 40000  # Starting number
+    if "has_car_warning" in projection:
+        stages.append({
+            "$lookup": {
+                "from": "car_notes",
+                "let": {"make": "$car_make", "model": "$car_model"},
+                "pipeline": [
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$and": [
+                                    {"$eq": ["$car_make", "$$make"]},
+                                    {"$eq": ["$car_model", "$$model"]}
+                                ]
+                            }
+                        }
+                    }
+                ],
+                "as": "car_warnings"
+            }
+        })
     
-    return str(next_num)
+    computed = {
+        "client_name": "$client.name",
+        "client_phone": "$client.phone",
+        "car_info": {
+            "$trim": {
+                "input": {
+                    "$concat": [
+                        "$car_make",
+                        " ",
+                        "$car_model",
+                        {
+                            "$cond": {
+                                "if": {"$ne": ["$car_year", None]},
+                                "then": {
+                                    "$concat": [" (", {"$toString": "$car_year"}, ")"]
+                                },
+                                "else": ""
+                            }
+                        }
+                    ]
+                }
+            }
+        },
+        "total_amount": {
+            "$add": ["$cleaning_price", "$reconditioning_price", "$turbo_price"]
+        },
+        # Stored as midnight datetimes, served as calendar days
+        "received_date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$received_date"}},
+        "estimated_completion": {
+            "$dateToString": {"format": "%Y-%m-%d", "date": "$estimated_completion", "onNull": None}
+        },
+        "has_turbo_warning": {"$gt": [{"$size": "$turbo_warnings"}, 0]},
+        "has_car_warning": {"$gt": [{"$size": "$car_warnings"}, 0]}
+    }
+    stages.append({
+        "$project": {name: computed.get(name, value) for name, value in projection.items()}
+    })
+    return stages
+
+
+# Helper functions for incrementally maintained client lifetime stats
+def work_order_total(work_order: dict) -> float:
+    """Order total as shown in the work order list"""
+    return (
+        work_order.get("cleaning_price", 0.0)
+        + work_order.get("reconditioning_price", 0.0)
+        + work_order.get("turbo_price", 0.0)
+    )
+
+async def apply_client_stats(before: Optional[dict], after: dict):
+    """Apply the difference between two images of a work order to its client's stats.
+
+    ``before`` is None for newly created orders.
+    """
+    client_id = after["client_id"]
+    inc = {}
+    if before is None:
+        inc["order_count"] = 1
+    spend_delta = work_order_total(after) - (work_order_total(before) if before else 0.0)
+    if spend_delta:
+        inc["total_spend"] = spend_delta
+    
+    update = {}
+    if inc:
+        update["$inc"] = inc
+    if before is None:
+        update["$max"] = {"last_visit": after["created_at"]}
+    if update:
+        await db.client_stats.update_one({"client_id": client_id}, update, upsert=True)
+    
+    old_code = before.get("turbo_code") if before else None
+    new_code = after.get("turbo_code")
+    if old_code == new_code:
+        return
+    if old_code:
+        await db.client_turbo_stats.update_one(
+            {"client_id": client_id, "turbo_code": old_code},
+            {"$inc": {"count": -1}}
+        )
+        await db.client_turbo_stats.delete_many(
+            {"client_id": client_id, "count": {"$lte": 0}}
+        )
+    if new_code:
+        await db.client_turbo_stats.update_one(
+            {"client_id": client_id, "turbo_code": new_code},
+            {"$inc": {"count": 1}},
+            upsert=True
+        )
+
+async def rebuild_client_stats(shop: str, client_id: str) -> dict:
+    """Recompute a client's stats from its work orders (backfill for older data)"""
+    totals = await db.work_orders.aggregate([
+        {"$match": {"shop_id": shop, "client_id": client_id}},
+        {
+            "$group": {
+                "_id": None,
+                "order_count": {"$sum": 1},
+                "total_spend": {
+                    "$sum": {"$add": ["$cleaning_price", "$reconditioning_price", "$turbo_price"]}
+                },
+                "last_visit": {"$max": "$created_at"}
+            }
+        }
+    ]).to_list(1)
+    turbo_counts = await db.work_orders.aggregate([
+        {"$match": {"shop_id": shop, "client_id": client_id, "turbo_code": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$turbo_code", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    
+    stats = {
+        "client_id": client_id,
+        "order_count": totals[0]["order_count"] if totals else 0,
+        "total_spend": totals[0]["total_spend"] if totals else 0.0,
+        "last_visit": totals[0]["last_visit"] if totals else None,
+        "complete": True
+    }
+    await db.client_stats.replace_one({"client_id": client_id}, stats, upsert=True)
+    await db.client_turbo_stats.delete_many({"client_id": client_id})
+    if turbo_counts:
+        await db.client_turbo_stats.insert_many([
+            {"client_id": client_id, "turbo_code": row["_id"], "count": row["count"]}
+            for row in turbo_counts
+        ])
+    return stats
+
+
+# Helper functions keeping the lookup indexes of every worker current
+def apply_lookup_change(change: dict):
+    """Apply a lookup index change to this worker's in-memory indexes.
+
+    ``turbo_codes`` holds ``[code, delta]`` pairs, ``observations`` holds
+    ``[turbo_code, car_make, car_model, engine_code, delta]`` rows and
+    ``notes`` holds searchable note documents.
+    """
+    for code, delta in change.get("turbo_codes", []):
+        if delta < 0:
+            turbo_code_index.remove(code, -delta)
+        else:
+            turbo_code_index.add(code, delta)
+    for model in change.get("catalog_models", []):
+        compatibility_index.add_catalog_model(
+            model["make"], model["model"], model["engine_codes"], model["turbo_codes"]
+        )
+    for *fields, delta in change.get("observations", []):
+        if delta < 0:
+            compatibility_index.remove_observation(*fields, -delta)
+        else:
+            compatibility_index.add_observation(*fields, delta)
+    for note in change.get("notes", []):
+        note_search_index.add(note)
+
+def searchable_note(note: dict, kind: NoteKind) -> dict:
+    fields = ("id", "note_type", "title", "description", "created_at",
+              "turbo_code", "car_make", "car_model", "engine_code")
+    return {"kind": kind.value, **{k: note[k] for k in fields if k in note}}
+
+# Collections whose contents show up in work order lists
+WORK_ORDER_LIST_SOURCES = ("work_orders", "clients", "turbo_notes", "car_notes")
+
+async def publish_changes(writes: Iterable[str] = (), lookup: Optional[dict] = None):
+    """Apply a request's effect on the caches here and in every other worker.
+
+    ``writes`` names the collections written, invalidating cached results
+    built from them; ``lookup`` is a lookup index change. Both travel in one
+    bus event, so a request costs one extra insert at most.
+    """
+    changes = {"writes": list(writes), "lookup": lookup or {}}
+    apply_changes(changes)
+    await invalidation_bus.publish("changes", changes)
+
+def apply_changes(changes: dict):
+    write_versions.bump(*changes["writes"])
+    apply_lookup_change(changes["lookup"])
+
+invalidation_bus.subscribe("changes", apply_changes)
+
+async def resync_caches():
+    """Rebuild this worker's caches after invalidation events were lost"""
+    work_order_list_cache.clear()
+    await load_lookup_indexes()
+
+invalidation_bus.on_resync(resync_caches)
+
+
+# Helper functions for status transition tracking
+async def update_stage_stats(transitions: List[dict]):
+    await db[turnaround.STAGE_STATS_COLLECTION].bulk_write(
+        turnaround.stage_stats_updates(transitions), ordered=False
+    )
+
+transition_log = WriteBehindBuffer(turnaround.TRANSITION_COLLECTION, on_flush=update_stage_stats)
+
+# Field-level diffs of work order updates
+audit_log = WriteBehindBuffer(audit.AUDIT_COLLECTION)
+
+async def get_stage_stats() -> dict:
+    docs = await db[turnaround.STAGE_STATS_COLLECTION].find().to_list(None)
+    return {doc["_id"]: doc for doc in docs}
+
+
+# Helper function keeping part reservations in line with a work order
+async def reserve_parts_for_update(existing: dict, update_data: dict) -> Optional[dict]:
+    """Reserve stock for a work order update before it is written.
+
+    Selected parts are reserved while the order is open, released when it
+    is REJECTED and consumed when it is DELIVERED. Adds the new
+    ``reserved_part_ids`` to ``update_data`` and raises 400 when a newly
+    selected part is out of stock. Returns the plan to pass to
+    ``settle_part_reservations`` once the update is written, or to
+    ``inventory.release(db, plan["reserve"])`` if it is not.
+    
+    Orders saved before inventory tracking have no ``reserved_part_ids``;
+    they hold nothing and stay outside tracking, so their parts are never
+    reserved, released or consumed. Untracked parts (stock never counted)
+    are skipped and retried on the next parts or status change.
+    """
+    if "parts" not in update_data and "status" not in update_data:
+        return None
+    if "reserved_part_ids" not in existing or existing["status"] == WorkStatus.DELIVERED:
+        return None
+    
+    status = update_data.get("status", existing["status"])
+    parts = update_data.get("parts", existing.get("parts", []))
+    held = existing["reserved_part_ids"]
+    wanted = [] if status == WorkStatus.REJECTED else [p["part_id"] for p in parts if p["selected"]]
+    to_reserve, to_release = inventory.reservation_plan(held, wanted)
+    if not to_reserve and not to_release and status != WorkStatus.DELIVERED:
+        return None
+    
+    try:
+        reserved = await inventory.reserve(db, to_reserve)
+    except inventory.InsufficientStock as exc:
+        part = next((p for p in parts if p["part_id"] == exc.part_id), {})
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nincs elegendő készlet: {part.get('part_code', exc.part_id)}"
+        )
+    
+    now_held = list((Counter(held) - Counter(to_release) + Counter(reserved)).elements())
+    consume = now_held if status == WorkStatus.DELIVERED else []
+    update_data["reserved_part_ids"] = [] if status == WorkStatus.DELIVERED else now_held
+    return {"reserve": reserved, "release": to_release, "consume": consume}
+
+async def settle_part_reservations(plan: Optional[dict]):
+    """Release and consume stock once the work order update is written"""
+    if plan:
+        await inventory.release(db, plan["release"])
+        await inventory.consume(db, plan["consume"])
+
+
+# Helper functions for work order revisions (ETag / If-Match / If-None-Match)
+def revision_etag(revision: int) -> str:
+    return f'"{revision}"'
+
+def etag_matches(header: str, revision: int) -> bool:
+    """Whether an If-Match / If-None-Match header value names ``revision``"""
+    etag = revision_etag(revision)
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# Helper function to generate work number
+async def generate_work_number(shop_id: str) -> str:
+    """Next number of the shop's own work number sequence"""
+    return await shops.next_work_number(db, shop_id)
 
 
 # API Endpoints
@@ -336,36 +901,60 @@ async def generate_work_number() -> str:
 async def root():
     return {"message": "Turbó Szerviz Kezelő API működik"}
 
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    """Ready once startup finished and while the database answers"""
+    if not app.state.ready:
+        return FastJSONResponse({"status": "starting"}, status_code=503)
+    if not await database.ping(client):
+        return FastJSONResponse({"status": "database_unavailable"}, status_code=503)
+    return {"status": "ready"}
+
 
 # Car Makes endpoints
 @api_router.post("/car-makes", response_model=CarMake)
 async def create_car_make(car_make: CarMakeCreate):
-    existing = await db.car_makes.find_one({"name": car_make.name})
-    if existing:
-        raise HTTPException(status_code=400, detail="Ez az autó márka már létezik")
-    
     car_make_obj = CarMake(**car_make.dict())
-    await db.car_makes.insert_one(car_make_obj.dict())
+    try:
+        await db.car_makes.insert_one(uniqueness.with_key("car_makes", car_make_obj.dict()))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ez az autó márka már létezik")
     return car_make_obj
 
 @api_router.get("/car-makes", response_model=List[CarMake])
-async def get_car_makes():
-    makes = await db.car_makes.find().sort("name", 1).to_list(1000)
-    return [CarMake(**make) for make in makes]
+async def get_car_makes(fields: Optional[str] = None):
+    projection = build_projection(CarMake, fields)
+    makes = await db.car_makes.find({}, projection).sort("name", 1).to_list(1000)
+    return FastJSONResponse(makes)
 
 @api_router.get("/car-models/{make_id}", response_model=List[CarModel])
-async def get_car_models(make_id: str):
-    models = await db.car_models.find({"make_id": make_id}).sort("name", 1).to_list(1000)
-    return [CarModel(**model) for model in models]
+async def get_car_models(make_id: str, fields: Optional[str] = None):
+    projection = build_projection(CarModel, fields)
+    models = await db.car_models.find({"make_id": make_id}, projection).sort("name", 1).to_list(1000)
+    return FastJSONResponse(models)
 
 @api_router.post("/car-models", response_model=CarModel)
 async def create_car_model(car_model: CarModelCreate):
-    existing = await db.car_models.find_one({"make_id": car_model.make_id, "name": car_model.name})
-    if existing:
+    car_model_obj = CarModel(**car_model.dict())
+    try:
+        await db.car_models.insert_one(uniqueness.with_key("car_models", car_model_obj.dict()))
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Ez a modell már létezik ehhez a márkához")
     
-    car_model_obj = CarModel(**car_model.dict())
-    await db.car_models.insert_one(car_model_obj.dict())
+    change = {"turbo_codes": [[code, 0] for code in car_model_obj.common_turbos]}
+    make = await db.car_makes.find_one({"id": car_model_obj.make_id}, {"_id": 0, "name": 1})
+    if make:
+        change["catalog_models"] = [{
+            "make": make["name"],
+            "model": car_model_obj.name,
+            "engine_codes": car_model_obj.engine_codes,
+            "turbo_codes": car_model_obj.common_turbos
+        }]
+    await publish_changes(lookup=change)
     return car_model_obj
 
 
@@ -374,27 +963,67 @@ async def create_car_model(car_model: CarModelCreate):
 async def create_turbo_note(note: TurboNoteCreate):
     note_obj = TurboNote(**note.dict())
     await db.turbo_notes.insert_one(note_obj.dict())
+    await publish_changes(["turbo_notes"], {
+        "turbo_codes": [[note_obj.turbo_code, 0]],
+        "notes": [searchable_note(note_obj.dict(), NoteKind.TURBO)]
+    })
     return note_obj
 
 @api_router.get("/turbo-notes/{turbo_code}", response_model=List[TurboNote])
-async def get_turbo_notes(turbo_code: str):
-    notes = await db.turbo_notes.find({"turbo_code": turbo_code, "active": True}).to_list(1000)
-    return [TurboNote(**note) for note in notes]
+async def get_turbo_notes(turbo_code: str, fields: Optional[str] = None):
+    projection = build_projection(TurboNote, fields)
+    notes = await db.turbo_notes.find({"turbo_code": turbo_code, "active": True}, projection).to_list(1000)
+    return FastJSONResponse(notes)
 
 @api_router.post("/car-notes", response_model=CarNote)
 async def create_car_note(note: CarNoteCreate):
     note_obj = CarNote(**note.dict())
     await db.car_notes.insert_one(note_obj.dict())
+    await publish_changes(["car_notes"], {"notes": [searchable_note(note_obj.dict(), NoteKind.CAR)]})
     return note_obj
 
 @api_router.get("/car-notes/{car_make}/{car_model}", response_model=List[CarNote])
-async def get_car_notes(car_make: str, car_model: str):
+async def get_car_notes(car_make: str, car_model: str, fields: Optional[str] = None):
+    projection = build_projection(CarNote, fields)
     notes = await db.car_notes.find({
         "car_make": car_make, 
         "car_model": car_model, 
         "active": True
-    }).to_list(1000)
-    return [CarNote(**note) for note in notes]
+    }, projection).to_list(1000)
+    return FastJSONResponse(notes)
+
+
+@api_router.get("/notes/search", response_model=List[NoteSearchHit])
+async def search_notes(
+    q: str,
+    kind: Optional[NoteKind] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    hits = note_search_index.search(q, limit, kind.value if kind else None)
+    return FastJSONResponse(hits)
+
+
+# Turbo code autocomplete
+@api_router.get("/turbo-codes/suggest", response_model=List[TurboCodeCount])
+async def suggest_turbo_codes(q: str = "", limit: int = Query(10, ge=1, le=50)):
+    return FastJSONResponse(turbo_code_index.suggest(q, limit))
+
+
+# Turbo compatibility lookups
+@api_router.get("/compatibility/turbos/{turbo_code}", response_model=TurboCompatibility)
+async def get_turbo_compatibility(turbo_code: str):
+    return FastJSONResponse({
+        "turbo_code": turbo_code,
+        "vehicles": compatibility_index.vehicles_for_turbo(turbo_code),
+        "engine_codes": compatibility_index.engines_for_turbo(turbo_code)
+    })
+
+@api_router.get("/compatibility/engines/{engine_code}", response_model=EngineCompatibility)
+async def get_engine_compatibility(engine_code: str):
+    return FastJSONResponse({
+        "engine_code": engine_code,
+        "turbo_codes": compatibility_index.turbos_for_engine(engine_code)
+    })
 
 
 # Work Process endpoints
@@ -405,9 +1034,10 @@ async def create_work_process(process: WorkProcessCreate):
     return process_obj
 
 @api_router.get("/work-processes", response_model=List[WorkProcess])
-async def get_work_processes():
-    processes = await db.work_processes.find({"active": True}).sort("category", 1).to_list(1000)
-    return [WorkProcess(**process) for process in processes]
+async def get_work_processes(fields: Optional[str] = None):
+    projection = build_projection(WorkProcess, fields)
+    processes = await db.work_processes.find({"active": True}, projection).sort("category", 1).to_list(1000)
+    return FastJSONResponse(processes)
 
 @api_router.put("/work-processes/{process_id}", response_model=WorkProcess)
 async def update_work_process(process_id: str, process_update: WorkProcessCreate):
@@ -434,31 +1064,52 @@ async def delete_work_process(process_id: str):
 # Turbo Parts endpoints
 @api_router.post("/turbo-parts", response_model=TurboPart)
 async def create_turbo_part(part: TurboPartCreate):
-    existing = await db.turbo_parts.find_one({"part_code": part.part_code})
-    if existing:
+    part_obj = TurboPart(**part.dict(), available=part.quantity)
+    try:
+        await db.turbo_parts.insert_one(uniqueness.with_key("turbo_parts", part_obj.dict()))
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Ez az alkatrész kód már létezik")
-    
-    part_obj = TurboPart(**part.dict())
-    await db.turbo_parts.insert_one(part_obj.dict())
     return part_obj
 
 @api_router.get("/turbo-parts", response_model=List[TurboPart])
-async def get_turbo_parts(category: Optional[str] = None):
+async def get_turbo_parts(category: Optional[str] = None, fields: Optional[str] = None):
     query = {"category": category} if category else {}
-    parts = await db.turbo_parts.find(query).sort("category", 1).to_list(1000)
-    return [TurboPart(**part) for part in parts]
+    projection = build_projection(TurboPart, fields)
+    parts = await db.turbo_parts.find(query, projection).sort("category", 1).to_list(1000)
+    return FastJSONResponse(parts)
 
 @api_router.put("/turbo-parts/{part_id}", response_model=TurboPart)
 async def update_turbo_part(part_id: str, part_update: TurboPartCreate):
-    await db.turbo_parts.update_one(
-        {"id": part_id}, 
-        {"$set": part_update.dict()}
-    )
+    # Stock levels only change through reservations and /stock adjustments
+    try:
+        await db.turbo_parts.update_one(
+            {"id": part_id}, 
+            {"$set": uniqueness.key_update("turbo_parts", part_update.dict(exclude={"quantity"}))}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ez az alkatrész kód már létezik")
     updated = await db.turbo_parts.find_one({"id": part_id})
     if not updated:
         raise HTTPException(status_code=404, detail="Alkatrész nem található")
     return TurboPart(**updated)
 
+@api_router.post("/turbo-parts/{part_id}/stock", response_model=TurboPart)
+async def adjust_turbo_part_stock(part_id: str, adjustment: StockAdjustment):
+    updated = await inventory.adjust(db, part_id, adjustment.delta)
+    if not updated:
+        if not await db.turbo_parts.find_one({"id": part_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Alkatrész nem található")
+        raise HTTPException(status_code=400, detail="A készlet nem csökkenthető a lefoglalt mennyiség alá")
+    return TurboPart(**updated)
+
+@api_router.get("/turbo-parts/low-stock", response_model=List[TurboPart])
+async def get_low_stock_parts(threshold: int = 2, fields: Optional[str] = None):
+    projection = build_projection(TurboPart, fields)
+    parts = await db.turbo_parts.find(
+        {"available": {"$lte": threshold}}, projection
+    ).sort("available", 1).to_list(1000)
+    return FastJSONResponse(parts)
+
 @api_router.delete("/turbo-parts/{part_id}")
 async def delete_turbo_part(part_id: str):
     result = await db.turbo_parts.delete_one({"id": part_id})
@@ -469,95 +1120,199 @@ async def delete_turbo_part(part_id: str):
 
 # Clients endpoints
 @api_router.post("/clients", response_model=Client)
-async def create_client(client: ClientCreate):
-    # Check if client already exists (by phone)
-    existing = await db.clients.find_one({"phone": client.phone})
-    if existing:
+async def create_client(client: ClientCreate, shop: str = Depends(current_shop)):
+    # Phone numbers are unique per shop through the phone_key index
+    client_obj = Client(**client.dict(), shop_id=shop)
+    try:
+        await db.clients.insert_one(uniqueness.with_key("clients", client_obj.dict()))
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Ügyfél ezzel a telefonszámmal már létezik")
-    
-    client_obj = Client(**client.dict())
-    await db.clients.insert_one(client_obj.dict())
+    await publish_changes(["clients"])
     return client_obj
 
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients(search: Optional[str] = None):
+async def get_clients(
+    search: Optional[str] = None,
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
+):
+    query = {"shop_id": shop}
     if search:
-        query = {
-            "$or": [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"phone": {"$regex": search, "$options": "i"}},
-                {"company_name": {"$regex": search, "$options": "i"}}
-            ]
-        }
-    else:
-        query = {}
+        query["$or"] = [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"phone": {"$regex": search, "$options": "i"}},
+            {"company_name": {"$regex": search, "$options": "i"}}
+        ]
     
-    clients = await db.clients.find(query).sort("name", 1).to_list(1000)
-    return [Client(**client) for client in clients]
+    projection = build_projection(Client, fields)
+    clients = await db.clients.find(query, projection).sort("name", 1).to_list(1000)
+    return FastJSONResponse(clients)
 
 @api_router.get("/clients/{client_id}", response_model=Client)
-async def get_client(client_id: str):
-    client = await db.clients.find_one({"id": client_id})
+async def get_client(client_id: str, shop: str = Depends(current_shop)):
+    client = await db.clients.find_one({"id": client_id, "shop_id": shop})
     if not client:
         raise HTTPException(status_code=404, detail="Ügyfél nem található")
     return Client(**client)
 
 @api_router.put("/clients/{client_id}", response_model=Client)
-async def update_client(client_id: str, client_update: ClientUpdate):
-    existing = await db.clients.find_one({"id": client_id})
+async def update_client(client_id: str, client_update: ClientUpdate, shop: str = Depends(current_shop)):
+    existing = await db.clients.find_one({"id": client_id, "shop_id": shop})
     if not existing:
         raise HTTPException(status_code=404, detail="Ügyfél nem található")
     
     update_data = {k: v for k, v in client_update.dict().items() if v is not None}
     if update_data:
         update_data["updated_at"] = datetime.utcnow()
-        await db.clients.update_one({"id": client_id}, {"$set": update_data})
+        try:
+            await db.clients.update_one(
+                {"id": client_id, "shop_id": shop}, {"$set": uniqueness.key_update("clients", update_data)}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Ügyfél ezzel a telefonszámmal már létezik")
+        await publish_changes(["clients"])
     
-    updated = await db.clients.find_one({"id": client_id})
+    updated = await db.clients.find_one({"id": client_id, "shop_id": shop})
     return Client(**updated)
 
+@api_router.get("/clients/{client_id}/history", response_model=ClientHistory)
+async def get_client_history(
+    client_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[datetime] = None,
+    shop: str = Depends(current_shop)
+):
+    order_query = {"shop_id": shop, "client_id": client_id}
+    if before:
+        order_query["created_at"] = {"$lt": before}
+    
+    client, stats, orders = await asyncio.gather(
+        db.clients.find_one({"id": client_id, "shop_id": shop}, build_projection(Client)),
+        db.client_stats.find_one({"client_id": client_id}, {"_id": 0}),
+        db.work_orders.find(order_query, build_projection(WorkOrder))
+            .sort("created_at", -1)
+            .limit(limit + 1)
+            .to_list(limit + 1)
+    )
+    if not client:
+        raise HTTPException(status_code=404, detail="Ügyfél nem található")
+    if not stats or not stats.get("complete"):
+        stats = await rebuild_client_stats(shop, client_id)
+    
+    top_turbo_codes = await db.client_turbo_stats.find(
+        {"client_id": client_id},
+        {"_id": 0, "turbo_code": 1, "count": 1}
+    ).sort([("count", -1), ("turbo_code", 1)]).to_list(5)
+    
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = orders[-1]["created_at"]
+    
+    stats.pop("complete", None)
+    stats["top_turbo_codes"] = top_turbo_codes
+    return FastJSONResponse({
+        "client": client,
+        "stats": stats,
+        "orders": [due_dates.from_mongo_dates(order) for order in orders],
+        "next_cursor": next_cursor
+    })
+
 
 # Vehicles endpoints
 @api_router.post("/vehicles", response_model=Vehicle)
-async def create_vehicle(vehicle: VehicleCreate):
-    client = await db.clients.find_one({"id": vehicle.client_id})
+async def create_vehicle(vehicle: VehicleCreate, shop: str = Depends(current_shop)):
+    client = await db.clients.find_one({"id": vehicle.client_id, "shop_id": shop}, {"_id": 1})
     if not client:
         raise HTTPException(status_code=400, detail="Ügyfél nem található")
     
-    vehicle_obj = Vehicle(**vehicle.dict())
+    vehicle_obj = Vehicle(**vehicle.dict(), shop_id=shop)
     await db.vehicles.insert_one(vehicle_obj.dict())
     return vehicle_obj
 
 @api_router.get("/vehicles", response_model=List[Vehicle])
-async def get_vehicles(client_id: Optional[str] = None):
-    query = {"client_id": client_id} if client_id else {}
-    vehicles = await db.vehicles.find(query).to_list(1000)
-    return [Vehicle(**vehicle) for vehicle in vehicles]
+async def get_vehicles(
+    client_id: Optional[str] = None,
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
+):
+    query = {"shop_id": shop}
+    if client_id:
+        query["client_id"] = client_id
+    projection = build_projection(Vehicle, fields)
+    vehicles = await db.vehicles.find(query, projection).to_list(1000)
+    return FastJSONResponse(vehicles)
 
 
 # Work Orders endpoints
 @api_router.post("/work-orders", response_model=WorkOrder)
-async def create_work_order(work_order: WorkOrderCreate):
-    client = await db.clients.find_one({"id": work_order.client_id})
+async def create_work_order(work_order: WorkOrderCreate, shop: str = Depends(current_shop)):
+    client = await db.clients.find_one({"id": work_order.client_id, "shop_id": shop}, {"_id": 1})
     if not client:
         raise HTTPException(status_code=400, detail="Ügyfél nem található")
     
-    work_number = await generate_work_number()
+    work_number = await generate_work_number(shop)
     
     work_order_obj = WorkOrder(
         work_number=work_number,
+        shop_id=shop,
         **work_order.dict()
     )
-    await db.work_orders.insert_one(work_order_obj.dict())
+    stored = due_dates.to_mongo_dates(work_order_obj.dict())
+    await db.work_orders.insert_one(stored)
+    await apply_client_stats(None, stored)
+    await reporting.apply_order_to_rollups(db, None, stored)
+    await publish_changes(["work_orders"], {
+        "turbo_codes": [[work_order_obj.turbo_code, 1]],
+        "observations": [[
+            work_order_obj.turbo_code, work_order_obj.car_make,
+            work_order_obj.car_model, work_order_obj.engine_code, 1
+        ]]
+    })
     return work_order_obj
 
 @api_router.get("/work-orders", response_model=List[WorkOrderWithDetails])
 async def get_work_orders(
     status: Optional[WorkStatus] = None,
     client_id: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    received_from: Optional[date] = None,
+    received_to: Optional[date] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
 ):
+    projection = build_projection(WorkOrderWithDetails, fields)
+    search = search.strip() if search else None
+    
+    # Filters on the order's own fields run before the client lookup
+    own_conditions = {"shop_id": shop}
+    if status:
+        own_conditions["status"] = status.value
+    if client_id:
+        own_conditions["client_id"] = client_id
+    received = due_dates.date_range(received_from, received_to)
+    if received:
+        own_conditions["received_date"] = received
+    due = due_dates.date_range(due_from, due_to)
+    if due:
+        own_conditions["estimated_completion"] = due
+    
+    cache_key = (
+        shop, status.value if status else None, client_id, search or None,
+        received_from, received_to, due_from, due_to, tuple(sorted(projection))
+    )
+    work_orders = await work_order_list_cache.get_or_compute(
+        cache_key,
+        WORK_ORDER_LIST_SOURCES,
+        lambda: query_work_orders(projection, own_conditions, search)
+    )
+    return FastJSONResponse(work_orders)
+
+async def query_work_orders(projection: dict, own_conditions: dict, search: Optional[str]) -> List[dict]:
     pipeline = [
+        {"$match": own_conditions},
         {
             "$lookup": {
                 "from": "clients",
@@ -566,134 +1321,447 @@ async def get_work_orders(
                 "as": "client"
             }
         },
-        {"$unwind": "$client"},
-        {
-            "$addFields": {
-                "car_info": {
-                    "$concat": [
-                        "$car_make",
-                        " ",
-                        "$car_model",
-                        {
-                            "$cond": {
-                                "if": {"$ne": ["$car_year", None]},
-                                "then": {
-                                    "$concat": [" (", {"$toString": "$car_year"}, ")"]
-                                },
-                                "else": ""
-                            }
-                        }
-                    ]
-                },
-                "total_amount": {
-                    "$add": ["$cleaning_price", "$reconditioning_price", "$turbo_price"]
-                }
-            }
-        }
+        {"$unwind": "$client"}
     ]
     
-    # Check for warnings
-    pipeline.append({
-        "$lookup": {
-            "from": "turbo_notes",
-            "localField": "turbo_code",
-            "foreignField": "turbo_code",
-            "as": "turbo_warnings"
-        }
-    })
-    
-    pipeline.append({
-        "$lookup": {
-            "from": "car_notes",
-            "let": {"make": "$car_make", "model": "$car_model"},
-            "pipeline": [
-                {
-                    "$match": {
-                        "$expr": {
-                            "$and": [
-                                {"$eq": ["$car_make", "$$make"]},
-                                {"$eq": ["$car_model", "$$model"]}
-                            ]
-                        }
-                    }
-                }
-            ],
-            "as": "car_warnings"
-        }
-    })
-    
-    pipeline.append({
-        "$addFields": {
-            "has_turbo_warning": {"$gt": [{"$size": "$turbo_warnings"}, 0]},
-            "has_car_warning": {"$gt": [{"$size": "$car_warnings"}, 0]}
-        }
-    })
-    
-    # Add filters
-    match_conditions = {}
-    if status:
-        match_conditions["status"] = status
-    if client_id:
-        match_conditions["client_id"] = client_id
     if search:
-        match_conditions["$or"] = [
-            {"work_number": {"$regex": search, "$options": "i"}},
-            {"turbo_code": {"$regex": search, "$options": "i"}},
-            {"client.name": {"$regex": search, "$options": "i"}},
-            {"car_make": {"$regex": search, "$options": "i"}},
-            {"car_model": {"$regex": search, "$options": "i"}}
-        ]
-    
-    if match_conditions:
-        pipeline.append({"$match": match_conditions})
+        pipeline.append({
+            "$match": {
+                "$or": [
+                    {"work_number": {"$regex": search, "$options": "i"}},
+                    {"turbo_code": {"$regex": search, "$options": "i"}},
+                    {"client.name": {"$regex": search, "$options": "i"}},
+                    {"car_make": {"$regex": search, "$options": "i"}},
+                    {"car_model": {"$regex": search, "$options": "i"}}
+                ]
+            }
+        })
     
     pipeline.append({"$sort": {"created_at": -1}})
+    pipeline.extend(work_order_details_stages(projection))
+    
+    return await db.work_orders.aggregate(pipeline).to_list(1000)
+
+@api_router.get("/work-orders/queues/{queue}", response_model=List[WorkOrderWithDetails])
+async def get_work_queue(
+    queue: WorkQueue,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
+):
+    """Planning queues, each a bounded range scan on a (shop, status, date) index"""
+    projection = build_projection(WorkOrderWithDetails, fields)
+    query, sort = due_dates.queue_query(queue.value, due_dates.shop_today())
+    pipeline = [
+        {"$match": {"shop_id": shop, **query}},
+        {"$sort": sort},
+        {"$limit": limit},
+        {
+            "$lookup": {
+                "from": "clients",
+                "localField": "client_id",
+                "foreignField": "id",
+                "as": "client"
+            }
+        },
+        {"$unwind": "$client"},
+        *work_order_details_stages(projection)
+    ]
+    work_orders = await db.work_orders.aggregate(pipeline).to_list(limit)
+    return FastJSONResponse(work_orders)
+
+# Status board endpoints
+def board_column_stages(
+    shop: str,
+    status: WorkStatus,
+    limit: int,
+    before: Optional[datetime],
+    projection: dict
+) -> List[dict]:
+    """Newest ``limit + 1`` orders of one column, read in order from the (shop, status, created_at) index"""
+    match = {"shop_id": shop, "status": status.value}
+    if before:
+        match["created_at"] = {"$lt": before}
+    return [
+        {"$match": match},
+        {"$sort": {"created_at": -1}},
+        {"$limit": limit + 1},
+        {
+            "$lookup": {
+                "from": "clients",
+                "localField": "client_id",
+                "foreignField": "id",
+                "as": "client"
+            }
+        },
+        {"$unwind": "$client"},
+        *work_order_details_stages(projection)
+    ]
+
+async def query_board(
+    shop: str,
+    statuses: List[WorkStatus],
+    limit: int,
+    before: Optional[datetime],
+    projection: dict
+) -> List[dict]:
+    """All requested columns and their totals in a single aggregation.
+
+    The column totals come first, then each column is appended with
+    ``$unionWith``; unlike ``$facet`` branches these sub-pipelines use the
+    index, so only ``limit + 1`` orders per column are ever read.
+    """
+    projection = {**projection, "status": 1, "created_at": 1}
+    pipeline = [
+        {"$match": {"shop_id": shop, "status": {"$in": [status.value for status in statuses]}}},
+        {"$group": {"_id": "$status", "column_total": {"$sum": 1}}},
+        {"$project": {"_id": 0, "status": "$_id", "column_total": 1}}
+    ]
+    for status in statuses:
+        pipeline.append({
+            "$unionWith": {
+                "coll": "work_orders",
+                "pipeline": board_column_stages(shop, status, limit, before, projection)
+            }
+        })
+    docs = await db.work_orders.aggregate(pipeline).to_list(None)
     
-    work_orders = await db.work_orders.aggregate(pipeline).to_list(1000)
-    
-    result = []
-    for wo in work_orders:
-        result.append(WorkOrderWithDetails(
-            id=wo["id"],
-            work_number=wo["work_number"],
-            client_name=wo["client"]["name"],
-            client_phone=wo["client"]["phone"],
-            car_info=wo.get("car_info", "").strip(),
-            turbo_code=wo["turbo_code"],
-            received_date=wo["received_date"],
-            status=wo["status"],
-            total_amount=wo["total_amount"],
-            estimated_completion=wo.get("estimated_completion"),
-            has_turbo_warning=wo.get("has_turbo_warning", False),
-            has_car_warning=wo.get("has_car_warning", False),
-            created_at=wo["created_at"]
-        ))
-    
-    return result
+    totals = {doc["status"]: doc["column_total"] for doc in docs if "column_total" in doc}
+    columns = []
+    for status in statuses:
+        orders = [doc for doc in docs if doc["status"] == status.value and "column_total" not in doc]
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = orders[-1]["created_at"]
+        columns.append({
+            "status": status.value,
+            "total": totals.get(status.value, 0),
+            "orders": orders,
+            "next_cursor": next_cursor
+        })
+    return columns
+
+@api_router.get("/work-orders/board", response_model=WorkOrderBoard)
+async def get_work_order_board(
+    limit: int = Query(20, ge=1, le=200),
+    statuses: Optional[str] = None,
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
+):
+    """Newest ``limit`` orders of every status column plus the column totals"""
+    try:
+        columns = [WorkStatus(s.strip()) for s in statuses.split(",")] if statuses else list(WorkStatus)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ismeretlen státusz")
+    projection = build_projection(WorkOrderWithDetails, fields)
+    cache_key = ("board", shop, tuple(columns), limit, tuple(sorted(projection)))
+    board = await work_order_list_cache.get_or_compute(
+        cache_key,
+        WORK_ORDER_LIST_SOURCES,
+        lambda: query_board(shop, columns, limit, None, projection)
+    )
+    return FastJSONResponse({"columns": board})
+
+@api_router.get("/work-orders/board/{status}", response_model=BoardColumn)
+async def get_work_order_board_column(
+    status: WorkStatus,
+    before: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=200),
+    fields: Optional[str] = None,
+    shop: str = Depends(current_shop)
+):
+    """Next page of one board column, ``before`` is the column's ``next_cursor``"""
+    projection = build_projection(WorkOrderWithDetails, fields)
+    columns = await query_board(shop, [status], limit, before, projection)
+    return FastJSONResponse(columns[0])
 
 @api_router.get("/work-orders/{work_order_id}", response_model=WorkOrder)
-async def get_work_order(work_order_id: str):
-    work_order = await db.work_orders.find_one({"id": work_order_id})
+async def get_work_order(
+    work_order_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    shop: str = Depends(current_shop)
+):
+    if if_none_match:
+        # Covered by the (shop_id, id, revision) index, the document itself is not loaded
+        current = await db.work_orders.find_one(
+            {"shop_id": shop, "id": work_order_id}, {"_id": 0, "revision": 1}
+        )
+        if not current:
+            raise HTTPException(status_code=404, detail="Munkalap nem található")
+        revision = current.get("revision", 0)
+        if etag_matches(if_none_match, revision):
+            return Response(status_code=304, headers={"ETag": revision_etag(revision)})
+    
+    work_order = await db.work_orders.find_one({"shop_id": shop, "id": work_order_id})
     if not work_order:
         raise HTTPException(status_code=404, detail="Munkalap nem található")
+    response.headers["ETag"] = revision_etag(work_order.get("revision", 0))
     return WorkOrder(**work_order)
 
 @api_router.put("/work-orders/{work_order_id}", response_model=WorkOrder)
-async def update_work_order(work_order_id: str, work_order_update: WorkOrderUpdate):
-    existing = await db.work_orders.find_one({"id": work_order_id})
+async def update_work_order(
+    work_order_id: str,
+    work_order_update: WorkOrderUpdate,
+    response: Response,
+    x_user: Optional[str] = Header(None),
+    if_match: Optional[str] = Header(None),
+    shop: str = Depends(current_shop)
+):
+    existing = await db.work_orders.find_one({"shop_id": shop, "id": work_order_id})
     if not existing:
         raise HTTPException(status_code=404, detail="Munkalap nem található")
+    if if_match and not etag_matches(if_match, existing.get("revision", 0)):
+        raise HTTPException(status_code=412, detail="A munkalapot közben módosították, töltse újra")
     
+    updated = existing
     update_data = {k: v for k, v in work_order_update.dict().items() if v is not None}
     if update_data:
-        update_data["updated_at"] = datetime.utcnow()
-        await db.work_orders.update_one({"id": work_order_id}, {"$set": update_data})
+        reservation_plan = await reserve_parts_for_update(existing, update_data)
+        update_data = due_dates.to_mongo_dates(update_data)
+        now = datetime.utcnow()
+        update_data["updated_at"] = now
+        status_changed = "status" in update_data and update_data["status"] != existing["status"]
+        if status_changed:
+            update_data["status_changed_at"] = now
+        # Only applies on top of the image read above, so the diffs derived
+        # from it below (stock, stats, audit) stay exact under concurrent saves
+        expected_revision = existing["revision"] if "revision" in existing else {"$exists": False}
+        updated = await db.work_orders.find_one_and_update(
+            {"shop_id": shop, "id": work_order_id, "revision": expected_revision},
+            {"$set": update_data, "$inc": {"revision": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not updated:
+            if reservation_plan:
+                await inventory.release(db, reservation_plan["reserve"])
+            raise HTTPException(
+                status_code=412 if if_match else 409,
+                detail="A munkalapot közben módosították, töltse újra"
+            )
+        await settle_part_reservations(reservation_plan)
+        
+        if status_changed:
+            entered = existing.get("status_changed_at") or existing["created_at"]
+            transition_log.append({
+                "id": str(uuid.uuid4()),
+                "work_order_id": work_order_id,
+                "shop_id": shop,
+                "from_status": existing["status"],
+                "to_status": update_data["status"].value,
+                "changed_at": now,
+                "duration_seconds": (now - entered).total_seconds()
+            })
+    
+    response.headers["ETag"] = revision_etag(updated.get("revision", 0))
+    changes = audit.diff(existing, updated)
+    if changes:
+        audit_log.append(audit.audit_entry(work_order_id, shop, changes, x_user, updated["updated_at"]))
+    await apply_client_stats(existing, updated)
+    await reporting.apply_order_to_rollups(db, existing, updated)
     
-    updated = await db.work_orders.find_one({"id": work_order_id})
+    change = {}
+    if updated["turbo_code"] != existing["turbo_code"]:
+        change["turbo_codes"] = [[existing["turbo_code"], -1], [updated["turbo_code"], 1]]
+    compatibility_fields = ("turbo_code", "car_make", "car_model", "engine_code")
+    if any(updated.get(f) != existing.get(f) for f in compatibility_fields):
+        change["observations"] = [
+            [*(existing.get(f) for f in compatibility_fields), -1],
+            [*(updated.get(f) for f in compatibility_fields), 1]
+        ]
+    if updated is not existing:
+        await publish_changes(["work_orders"], change)
     return WorkOrder(**updated)
 
 
+@api_router.get("/work-orders/{work_order_id}/audit", response_model=List[AuditEntry])
+async def get_work_order_audit(
+    work_order_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    shop: str = Depends(current_shop)
+):
+    projection = build_projection(AuditEntry)
+    # Changes still waiting in the write-behind buffer are the newest ones
+    pending = [
+        {k: v for k, v in entry.items() if projection.get(k)}
+        for entry in reversed(audit_log.pending())
+        if entry["work_order_id"] == work_order_id and entry["shop_id"] == shop
+    ]
+    entries = await db[audit.AUDIT_COLLECTION].find(
+        {"shop_id": shop, "work_order_id": work_order_id}, projection
+    ).sort("changed_at", -1).to_list(limit)
+    return FastJSONResponse((pending + entries)[:limit])
+
+
+# Turnaround analytics endpoints
+@api_router.get("/work-orders/{work_order_id}/transitions", response_model=List[StatusTransition])
+async def get_work_order_transitions(work_order_id: str, shop: str = Depends(current_shop)):
+    projection = build_projection(StatusTransition)
+    transitions = await db[turnaround.TRANSITION_COLLECTION].find(
+        {"shop_id": shop, "work_order_id": work_order_id}, projection
+    ).sort("changed_at", 1).to_list(None)
+    # Include changes still waiting in the write-behind buffer
+    transitions += [
+        {k: v for k, v in transition.items() if projection.get(k)}
+        for transition in transition_log.pending()
+        if transition["work_order_id"] == work_order_id and transition["shop_id"] == shop
+    ]
+    return FastJSONResponse(transitions)
+
+@api_router.get("/work-orders/{work_order_id}/estimate", response_model=CompletionEstimate)
+async def estimate_work_order_completion(work_order_id: str, shop: str = Depends(current_shop)):
+    work_order, stats_by_status = await asyncio.gather(
+        db.work_orders.find_one(
+            {"shop_id": shop, "id": work_order_id},
+            {"_id": 0, "status": 1, "status_changed_at": 1, "created_at": 1, "processes": 1}
+        ),
+        get_stage_stats()
+    )
+    if not work_order:
+        raise HTTPException(status_code=404, detail="Munkalap nem található")
+    
+    now = datetime.utcnow()
+    entered = work_order.get("status_changed_at") or work_order["created_at"]
+    averages = {
+        status: turnaround.summarize(status, stats)["avg_seconds"]
+        for status, stats in stats_by_status.items()
+    }
+    process_seconds = 60 * sum(
+        process["estimated_time"] for process in work_order.get("processes", []) if process.get("selected")
+    )
+    remaining = turnaround.estimate_remaining_seconds(
+        work_order["status"], (now - entered).total_seconds(), averages, process_seconds
+    )
+    return CompletionEstimate(
+        work_order_id=work_order_id,
+        status=work_order["status"],
+        remaining_seconds=remaining,
+        estimated_completion=(now + timedelta(seconds=remaining)).date()
+    )
+
+@api_router.get("/analytics/turnaround", response_model=TurnaroundReport)
+async def get_turnaround_analytics():
+    now = datetime.utcnow()
+    stats_by_status = await get_stage_stats()
+    cutoffs = turnaround.stalled_cutoffs(now, stats_by_status)
+    
+    if cutoffs:
+        stalled = {
+            "$cond": [
+                {
+                    "$lt": [
+                        {"$ifNull": ["$status_changed_at", "$created_at"]},
+                        {
+                            "$switch": {
+                                "branches": [
+                                    {"case": {"$eq": ["$status", status]}, "then": cutoff}
+                                    for status, cutoff in cutoffs.items()
+                                ],
+                                "default": None
+                            }
+                        }
+                    ]
+                },
+                1,
+                0
+            ]
+        }
+    else:
+        stalled = 0
+    
+    work_orders = database.for_reports(db.work_orders)
+    open_rows, overdue_count = await asyncio.gather(
+        work_orders.aggregate([
+            {"$match": {"status": {"$nin": turnaround.CLOSED_STATUSES}}},
+            {
+                "$group": {
+                    "_id": "$status",
+                    "open_count": {"$sum": 1},
+                    "stalled_count": {"$sum": stalled}
+                }
+            }
+        ]).to_list(None),
+        work_orders.count_documents(due_dates.queue_query("overdue", due_dates.shop_today())[0])
+    )
+    open_by_status = {row["_id"]: row for row in open_rows}
+    
+    stages = []
+    for status in WorkStatus:
+        stage = turnaround.summarize(status.value, stats_by_status.get(status.value))
+        stage["open_count"] = open_by_status.get(status.value, {}).get("open_count", 0)
+        stage["stalled_count"] = open_by_status.get(status.value, {}).get("stalled_count", 0)
+        stages.append(stage)
+    return FastJSONResponse({"stages": stages, "overdue_count": overdue_count})
+
+
+# Reports endpoints
+@api_router.get("/reports/monthly", response_model=List[MonthlyRollup])
+async def get_monthly_report(
+    dimension: ReportDimension = ReportDimension.TOTAL,
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$")
+):
+    query = {"dimension": dimension.value}
+    month_range = {}
+    if start:
+        month_range["$gte"] = start
+    if end:
+        month_range["$lte"] = end
+    if month_range:
+        query["month"] = month_range
+    
+    rollups = await database.for_reports(db[reporting.ROLLUP_COLLECTION]).find(
+        query, build_projection(MonthlyRollup)
+    ).sort([("month", 1), ("revenue", -1)]).to_list(None)
+    return FastJSONResponse(rollups)
+
+@api_router.post("/reports/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_reports():
+    """Full recomputation for backfills, see ``reporting.rebuild_rollups`` (writes must be paused)"""
+    count = await reporting.rebuild_rollups(db)
+    return {"message": "Riportok újraszámolva", "rollups": count}
+
+
+# Admin endpoints
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def get_request_profiles(limit: int = Query(50, ge=1, le=500)):
+    return profile_store.list(limit)
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_request_profile(profile_id: str):
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profil nem található")
+    return profile
+
+@api_router.get("/admin/cache-stats", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    return {"work_orders": work_order_list_cache.stats()}
+
+@api_router.get("/admin/db-pool", dependencies=[Depends(require_admin)])
+async def get_db_pool_stats():
+    pool_options = client.options.pool_options
+    return {
+        "min_pool_size": pool_options.min_pool_size,
+        "max_pool_size": pool_options.max_pool_size,
+        **pool_metrics.to_dict()
+    }
+
+@api_router.get("/admin/duplicates", dependencies=[Depends(require_admin)])
+async def get_duplicate_report():
+    """Existing duplicates that keep a unique index from being created"""
+    return await uniqueness.find_duplicates(db)
+
+
 # Initialize default data
+async def insert_missing(collection, key: str, docs: List[dict]):
+    """Insert the docs whose ``key`` value is not in the collection yet, in one round trip"""
+    await collection.bulk_write(
+        [UpdateOne({key: doc[key]}, {"$setOnInsert": doc}, upsert=True) for doc in docs],
+        ordered=False
+    )
+
 @api_router.post("/initialize-data")
 async def initialize_data():
     # Initialize car makes
@@ -702,11 +1770,10 @@ async def initialize_data():
         "Peugeot", "Renault", "Opel", "Citroen", "Skoda"
     ]
     
-    for make_name in car_makes:
-        existing = await db.car_makes.find_one({"name": make_name})
-        if not existing:
-            make_obj = CarMake(name=make_name)
-            await db.car_makes.insert_one(make_obj.dict())
+    await insert_missing(
+        db.car_makes, "name_key",
+        [uniqueness.with_key("car_makes", CarMake(name=name).dict()) for name in car_makes]
+    )
     
     # Initialize work processes
     default_processes = [
@@ -718,11 +1785,10 @@ async def initialize_data():
         {"name": "Tesztelés", "category": "Testing", "estimated_time": 30, "base_price": 40.0},
     ]
     
-    for process_data in default_processes:
-        existing = await db.work_processes.find_one({"name": process_data["name"]})
-        if not existing:
-            process_obj = WorkProcess(**process_data)
-            await db.work_processes.insert_one(process_obj.dict())
+    await insert_missing(
+        db.work_processes, "name",
+        [WorkProcess(**process_data).dict() for process_data in default_processes]
+    )
     
     # Initialize turbo parts
     default_parts = [
@@ -736,11 +1802,10 @@ async def initialize_data():
         {"category": "SET.GAR", "part_code": "K7-110691", "supplier": "Vallion", "price": 22.0},
     ]
     
-    for part_data in default_parts:
-        existing = await db.turbo_parts.find_one({"part_code": part_data["part_code"]})
-        if not existing:
-            part_obj = TurboPart(**part_data)
-            await db.turbo_parts.insert_one(part_obj.dict())
+    await insert_missing(
+        db.turbo_parts, "part_code_key",
+        [uniqueness.with_key("turbo_parts", TurboPart(**part_data).dict()) for part_data in default_parts]
+    )
     
     return {"message": "Alapadatok inicializálva"}
 
@@ -756,6 +1821,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+)
+
+app.add_middleware(
+    ProfilingMiddleware,
+    store=profile_store,
+    admin_token=os.environ.get('ADMIN_TOKEN'),
+    sample_rate=float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -763,6 +1840,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def create_indexes():
+    # Shop-scoped queries filter on shop_id first, so every index starts with it
+    await db.work_orders.create_index([("shop_id", 1), ("client_id", 1), ("created_at", -1)])
+    await db.work_orders.create_index([("shop_id", 1), ("id", 1), ("revision", 1)])
+    await db.work_orders.create_index([("shop_id", 1), ("work_number", 1)])
+    await db.clients.create_index([("shop_id", 1), ("name", 1)])
+    await db.vehicles.create_index([("shop_id", 1), ("client_id", 1)])
+    await db.client_stats.create_index("client_id", unique=True)
+    await db.client_turbo_stats.create_index([("client_id", 1), ("turbo_code", 1)], unique=True)
+    await db.client_turbo_stats.create_index([("client_id", 1), ("count", -1)])
+    await db[reporting.ROLLUP_COLLECTION].create_index([("dimension", 1), ("month", 1)])
+    await db.work_orders.create_index([("shop_id", 1), ("status", 1), ("status_changed_at", 1)])
+    await db.work_orders.create_index([("shop_id", 1), ("status", 1), ("created_at", -1)])
+    await db.work_orders.create_index([("shop_id", 1), ("status", 1), ("estimated_completion", 1)])
+    await db.work_orders.create_index([("shop_id", 1), ("received_date", -1)])
+    # Turnaround analytics span all shops
+    await db.work_orders.create_index([("status", 1), ("status_changed_at", 1)])
+    await db.work_orders.create_index([("status", 1), ("estimated_completion", 1)])
+    await db.turbo_parts.create_index("available")
+    await db[turnaround.TRANSITION_COLLECTION].create_index([("shop_id", 1), ("work_order_id", 1), ("changed_at", 1)])
+    await db[audit.AUDIT_COLLECTION].create_index([("shop_id", 1), ("work_order_id", 1), ("changed_at", -1)])
+
+async def run_migrations():
+    converted = await due_dates.migrate_date_fields(db)
+    if converted:
+        logger.info("Converted %d work order dates from strings", converted)
+    
+    assigned = await shops.backfill_shop_ids(db)
+    if assigned:
+        logger.info("Assigned %d documents to shop %s", assigned, shops.default_shop_id())
+    await shops.backfill_history_shop_ids(db)
+    
+    backfilled = await uniqueness.backfill_keys(db)
+    if backfilled:
+        logger.info("Stored uniqueness keys on %d documents", backfilled)
+    if await uniqueness.ensure_unique_indexes(db):
+        for duplicate in await uniqueness.find_duplicates(db):
+            logger.warning("Duplicate %s: %s", duplicate["collection"], duplicate["values"])
+
+async def start_write_buffers():
+    await transition_log.start(db)
+    await audit_log.start(db)
+
+async def start_invalidation_bus():
+    # Started before the lookup indexes load so no change is missed in between
+    await invalidation_bus.start(db)
+
+async def load_lookup_indexes():
+    observed = await db.work_orders.aggregate([
+        {
+            "$group": {
+                "_id": {
+                    "turbo_code": "$turbo_code",
+                    "car_make": "$car_make",
+                    "car_model": "$car_model",
+                    "engine_code": "$engine_code"
+                },
+                "count": {"$sum": 1}
+            }
+        }
+    ]).to_list(None)
+    turbo_notes = await db.turbo_notes.find({"active": True}, {"_id": 0}).to_list(None)
+    car_notes = await db.car_notes.find({"active": True}, {"_id": 0}).to_list(None)
+    car_models = await db.car_models.find(
+        {}, {"_id": 0, "make_id": 1, "name": 1, "engine_codes": 1, "common_turbos": 1}
+    ).to_list(None)
+    make_names = {
+        make["id"]: make["name"]
+        for make in await db.car_makes.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    }
+    
+    turbo_code_index.load(
+        [(row["_id"]["turbo_code"], row["count"]) for row in observed if row["_id"].get("turbo_code")]
+        + [(note["turbo_code"], 0) for note in turbo_notes if note.get("turbo_code")]
+        + [(code, 0) for model in car_models for code in model.get("common_turbos", [])]
+    )
+    
+    compatibility_index.clear()
+    for model in car_models:
+        if model["make_id"] in make_names:
+            compatibility_index.add_catalog_model(
+                make_names[model["make_id"]], model["name"],
+                model.get("engine_codes", []), model.get("common_turbos", [])
+            )
+    for row in observed:
+        pair = row["_id"]
+        compatibility_index.add_observation(
+            pair.get("turbo_code"), pair.get("car_make"), pair.get("car_model"),
+            pair.get("engine_code"), row["count"]
+        )
+    
+    note_search_index.clear()
+    for note in turbo_notes:
+        note_search_index.add(searchable_note(note, NoteKind.TURBO))
+    for note in car_notes:
+        note_search_index.add(searchable_note(note, NoteKind.CAR))
+    logger.info(
+        "Lookup indexes loaded with %d turbo codes and %d notes",
+        len(turbo_code_index), len(note_search_index)
+    )
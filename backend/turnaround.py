@@ -0,0 +1,125 @@
+"""Status transition statistics and turnaround estimates.
+
+Every status change of a work order is logged as a transition carrying how
+long the order spent in the status it left. Per-status duration statistics
+(count, sum, max and a fixed log-scale histogram) live in ``stage_stats``
+and are updated with ``$inc`` whenever a batch of transitions is flushed,
+so averages and percentiles never require scanning the log.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+TRANSITION_COLLECTION = "status_transitions"
+STAGE_STATS_COLLECTION = "stage_stats"
+
+# Normal route of a work order through the shop, REJECTED ends it early
+STAGE_FLOW = ["RECEIVED", "IN_PROGRESS", "QUOTED", "ACCEPTED", "WORKING", "READY", "DELIVERED"]
+CLOSED_STATUSES = ["READY", "DELIVERED", "REJECTED"]
+
+_MINUTE = 60
+_HOUR = 60 * _MINUTE
+_DAY = 24 * _HOUR
+# Upper bounds (seconds) of the histogram buckets, the last bucket is open
+BUCKET_BOUNDS = [
+    5 * _MINUTE, 15 * _MINUTE, 30 * _MINUTE, _HOUR, 2 * _HOUR, 4 * _HOUR, 8 * _HOUR,
+    12 * _HOUR, _DAY, 2 * _DAY, 3 * _DAY, 5 * _DAY, 7 * _DAY, 14 * _DAY, 30 * _DAY,
+]
+
+
+def bucket_index(seconds: float) -> int:
+    return bisect_right(BUCKET_BOUNDS, seconds)
+
+
+def stage_stats_updates(transitions: List[dict]) -> List[UpdateOne]:
+    """One ``$inc`` per left status for a batch of transitions"""
+    grouped: Dict[str, dict] = defaultdict(lambda: {"inc": defaultdict(float), "max": 0.0})
+    for transition in transitions:
+        seconds = transition["duration_seconds"]
+        stats = grouped[transition["from_status"]]
+        stats["inc"]["count"] += 1
+        stats["inc"]["sum_seconds"] += seconds
+        stats["inc"][f"buckets.{bucket_index(seconds)}"] += 1
+        stats["max"] = max(stats["max"], seconds)
+
+    return [
+        UpdateOne(
+            {"_id": status},
+            {"$inc": dict(stats["inc"]), "$max": {"max_seconds": stats["max"]}},
+            upsert=True
+        )
+        for status, stats in grouped.items()
+    ]
+
+
+def percentile(stats: dict, fraction: float) -> Optional[float]:
+    """Percentile estimated from the histogram by interpolating inside a bucket"""
+    count = stats.get("count", 0)
+    if not count:
+        return None
+    buckets = stats.get("buckets", {})
+    rank = fraction * count
+    seen = 0
+    for index in range(len(BUCKET_BOUNDS) + 1):
+        in_bucket = buckets.get(str(index), 0)
+        if in_bucket and seen + in_bucket >= rank:
+            lower = BUCKET_BOUNDS[index - 1] if index else 0
+            upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else stats.get("max_seconds", lower)
+            upper = min(upper, stats.get("max_seconds", upper))
+            return lower + (upper - lower) * (rank - seen) / in_bucket
+        seen += in_bucket
+    return stats.get("max_seconds")
+
+
+def summarize(status: str, stats: Optional[dict]) -> dict:
+    stats = stats or {}
+    count = int(stats.get("count", 0))
+    return {
+        "status": status,
+        "count": count,
+        "avg_seconds": stats["sum_seconds"] / count if count else None,
+        "p50_seconds": percentile(stats, 0.5),
+        "p90_seconds": percentile(stats, 0.9),
+        "p95_seconds": percentile(stats, 0.95),
+        "max_seconds": stats.get("max_seconds"),
+    }
+
+
+def estimate_remaining_seconds(
+    status: str,
+    in_status_seconds: float,
+    averages: Dict[str, Optional[float]],
+    process_seconds: float = 0.0,
+) -> float:
+    """Expected time until an order in ``status`` becomes READY.
+
+    Sums the historical average of the current stage (minus the time already
+    spent in it) and of every later stage up to READY. For the WORKING stage
+    the selected processes' own estimate is used when it is longer than the
+    historical average.
+    """
+    if status not in STAGE_FLOW or STAGE_FLOW.index(status) >= STAGE_FLOW.index("READY"):
+        return 0.0
+
+    remaining = 0.0
+    for stage in STAGE_FLOW[STAGE_FLOW.index(status):STAGE_FLOW.index("READY")]:
+        expected = averages.get(stage) or 0.0
+        if stage == "WORKING":
+            expected = max(expected, process_seconds)
+        if stage == status:
+            expected = max(expected - in_status_seconds, 0.0)
+        remaining += expected
+    return remaining
+
+
+def stalled_cutoffs(now: datetime, stats_by_status: Dict[str, dict]) -> Dict[str, datetime]:
+    """Orders that entered a status before its cutoff have been there longer than its p90"""
+    cutoffs = {}
+    for status, stats in stats_by_status.items():
+        p90 = percentile(stats, 0.9)
+        if p90 is not None and status not in CLOSED_STATUSES:
+            cutoffs[status] = now - timedelta(seconds=p90)
+    return cutoffs
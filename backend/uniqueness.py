@@ -0,0 +1,136 @@
+"""Uniqueness of client phones (per shop), car makes, car models and part codes.
+
+Each guarded collection stores a normalized key next to the user-entered
+value and a unique index on it enforces uniqueness. Creates insert
+directly and turn ``DuplicateKeyError`` into the usual 400 response, so
+there is no check-then-insert race between concurrent requests.
+"""
+import logging
+import re
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+_NON_DIGIT = re.compile(r"\D")
+_NON_ALNUM = re.compile(r"[\W_]")
+
+
+def phone_key(phone: str) -> str:
+    """'+36 30 123 4567', '06-30-123-4567' and '0036301234567' -> '301234567'"""
+    raw = (phone or "").strip()
+    digits = _NON_DIGIT.sub("", raw)
+    if digits.startswith("0036"):
+        return digits[4:]
+    if raw.startswith("+36"):
+        return digits[2:]
+    if digits.startswith("06"):
+        return digits[2:]
+    return digits
+
+
+def name_key(name: str) -> str:
+    """Case-folded name with whitespace collapsed: ' Mercedes  BENZ' -> 'mercedes benz'"""
+    return " ".join((name or "").split()).casefold()
+
+
+def code_key(code: str) -> str:
+    """Case-folded alphanumerics only: '1303-090-400' -> '1303090400'"""
+    return _NON_ALNUM.sub("", (code or "").casefold())
+
+
+class UniqueKey(NamedTuple):
+    collection: str
+    field: str                      # Stored normalized key
+    source: str                     # User-entered field it is derived from
+    normalize: Callable[[str], str]
+    scope: Tuple[str, ...] = ()     # Unique only within these fields
+
+
+UNIQUE_KEYS: List[UniqueKey] = [
+    UniqueKey("clients", "phone_key", "phone", phone_key, ("shop_id",)),
+    UniqueKey("car_makes", "name_key", "name", name_key),
+    UniqueKey("car_models", "name_key", "name", name_key, ("make_id",)),
+    UniqueKey("turbo_parts", "part_code_key", "part_code", code_key),
+]
+_BY_COLLECTION: Dict[str, UniqueKey] = {key.collection: key for key in UNIQUE_KEYS}
+
+
+def with_key(collection: str, doc: dict) -> dict:
+    """Copy of ``doc`` with the collection's normalized key added"""
+    key = _BY_COLLECTION[collection]
+    return {**doc, key.field: key.normalize(doc[key.source])}
+
+
+def key_update(collection: str, update: dict) -> dict:
+    """Add the normalized key to a ``$set`` document that changes the source field"""
+    key = _BY_COLLECTION[collection]
+    if key.source in update:
+        return {**update, key.field: key.normalize(update[key.source])}
+    return update
+
+
+async def backfill_keys(db) -> int:
+    """Store normalized keys on documents written before they existed"""
+    total = 0
+    for key in UNIQUE_KEYS:
+        collection = db[key.collection]
+        cursor = collection.find({key.field: {"$exists": False}}, {"_id": 1, key.source: 1})
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {key.field: key.normalize(doc.get(key.source, ""))}})
+            async for doc in cursor
+        ]
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            total += len(operations)
+    return total
+
+
+async def find_duplicates(db) -> List[dict]:
+    """Groups of documents that share a normalized key, i.e. block the unique index"""
+    report = []
+    for key in UNIQUE_KEYS:
+        group_id = {field: f"${field}" for field in (*key.scope, key.field)}
+        groups = await db[key.collection].aggregate([
+            {"$match": {key.field: {"$exists": True}}},
+            {"$group": {
+                "_id": group_id,
+                "count": {"$sum": 1},
+                "ids": {"$push": "$id"},
+                "values": {"$addToSet": f"${key.source}"}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]).to_list(None)
+        for group in groups:
+            report.append({
+                "collection": key.collection,
+                "key": group["_id"],
+                "count": group["count"],
+                "ids": group["ids"],
+                "values": group["values"],
+            })
+    return report
+
+
+async def ensure_unique_indexes(db) -> List[str]:
+    """Create the unique indexes, returns the collections where duplicates prevented it"""
+    blocked = []
+    for key in UNIQUE_KEYS:
+        collection = db[key.collection]
+        fields = [(field, 1) for field in (*key.scope, key.field)]
+        name = f"{key.field}_unique"
+        existing = (await collection.index_information()).get(name)
+        if existing and list(existing["key"]) != fields:
+            # Scope changed (e.g. phones became unique per shop), rebuild it
+            await collection.drop_index(name)
+        try:
+            await collection.create_index(fields, unique=True, name=name)
+        except OperationFailure as exc:
+            logger.error(
+                "Unique index on %s.%s not created, resolve duplicates first: %s",
+                key.collection, key.field, exc
+            )
+            blocked.append(key.collection)
+    return blocked
@@ -0,0 +1,119 @@
+"""Write-behind buffering for append-only collections."""
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Collects documents in memory and inserts them in batches off the request path.
+
+    ``append`` never waits for the database. A background task flushes every
+    ``flush_interval`` seconds, or sooner once ``max_batch`` documents are
+    waiting. Memory is bounded by ``max_size``: when the database cannot keep
+    up the oldest pending documents are dropped and counted in ``dropped``.
+    ``on_flush`` is awaited with the documents of every batch that were inserted.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        max_batch: int = 500,
+        max_size: int = 10000,
+        flush_interval: float = 1.0,
+        on_flush: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        self.collection_name = collection_name
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.dropped = 0
+        self.written = 0
+        self._pending: deque = deque(maxlen=max_size)
+        self._collection = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def append(self, doc: dict):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+            logger.warning("%s buffer full, dropping oldest entry", self.collection_name)
+        self._pending.append(doc)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self) -> List[dict]:
+        return list(self._pending)
+
+    async def start(self, db):
+        self._collection = db[self.collection_name]
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush whatever is still pending.
+
+        The task is asked to stop rather than cancelled, so a flush it is in
+        the middle of completes (including ``on_flush``) first.
+        """
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if self._collection is None:
+            return
+        async with self._lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                try:
+                    await self._collection.insert_many(batch, ordered=False)
+                except asyncio.CancelledError:
+                    # Whether it was written is unknown; keep it rather than lose it
+                    self._requeue(batch)
+                    raise
+                except BulkWriteError as exc:
+                    # Partially written, retrying would only duplicate the rest
+                    logger.warning("Flushing %s partially failed: %s", self.collection_name, exc.details)
+                    failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+                    batch = [doc for index, doc in enumerate(batch) if index not in failed]
+                except PyMongoError as exc:
+                    logger.warning("Flushing %s failed, will retry: %s", self.collection_name, exc)
+                    self._requeue(batch)
+                    return
+                self.written += len(batch)
+                if self.on_flush:
+                    try:
+                        await self.on_flush(batch)
+                    except PyMongoError:
+                        logger.exception("Post-flush hook for %s failed", self.collection_name)
+
+    def _requeue(self, batch: List[dict]):
+        """Put a failed batch back in front, dropping its oldest entries if that overflows"""
+        overflow = len(self._pending) + len(batch) - self._pending.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            logger.warning("%s buffer full, dropping %d oldest entries", self.collection_name, overflow)
+            batch = batch[overflow:]
+        self._pending.extendleft(reversed(batch))
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
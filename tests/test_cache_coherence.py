@@ -0,0 +1,116 @@
+"""Cache coherence across API worker processes.
+
+Starts several API processes against the same local mongod and checks that
+a write handled by one worker shows up in the in-memory lookups of the
+others. Needs uvicorn and a reachable MongoDB (TEST_MONGO_URL, defaults to
+localhost); the module is skipped otherwise.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pymongo = pytest.importorskip("pymongo")
+pytest.importorskip("uvicorn")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+WORKER_COUNT = 3
+
+
+def _mongo_available():
+    try:
+        pymongo.MongoClient(MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except pymongo.errors.PyMongoError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not _mongo_available(), reason="needs a local mongod")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _eventually(check, timeout=10.0, interval=0.2):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if check():
+                return
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met within %.1fs" % timeout)
+        time.sleep(interval)
+
+
+@pytest.fixture(scope="module")
+def workers():
+    db_name = "turbo_coherence_%s" % uuid.uuid4().hex[:8]
+    env = {**os.environ, "MONGO_URL": MONGO_URL, "TURBO_DB_NAME": db_name}
+    processes, urls = [], []
+    for _ in range(WORKER_COUNT):
+        port = _free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+        urls.append("http://127.0.0.1:%d/api" % port)
+    try:
+        for url in urls:
+            _eventually(lambda: requests.get(url + "/").ok, timeout=30)
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+        pymongo.MongoClient(MONGO_URL).drop_database(db_name)
+
+
+def _create_work_order(url, **fields):
+    client = requests.post(url + "/clients", json={
+        "name": "Coherence Test",
+        "phone": uuid.uuid4().hex[:10],
+    }).json()
+    response = requests.post(url + "/work-orders", json={"client_id": client["id"], **fields})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_turbo_code_written_on_one_worker_is_suggested_by_all(workers):
+    turbo_code = "CC-%s" % uuid.uuid4().hex[:6].upper()
+    _create_work_order(workers[0], turbo_code=turbo_code)
+
+    for url in workers:
+        _eventually(lambda: any(
+            row["turbo_code"] == turbo_code
+            for row in requests.get(url + "/turbo-codes/suggest", params={"q": turbo_code}).json()
+        ))
+
+
+def test_compatibility_change_reaches_every_worker(workers):
+    turbo_code = "CC-%s" % uuid.uuid4().hex[:6].upper()
+    work_order = _create_work_order(
+        workers[1], turbo_code=turbo_code, car_make="BMW", car_model="X5", engine_code="M57D30"
+    )
+    requests.put(workers[1] + "/work-orders/" + work_order["id"], json={"car_model": "X3"})
+
+    def models(url):
+        data = requests.get(url + "/compatibility/turbos/" + turbo_code).json()
+        return [vehicle["car_model"] for vehicle in data["vehicles"]]
+
+    for url in workers:
+        _eventually(lambda: models(url) == ["X3"])
@@ -0,0 +1,129 @@
+"""Part reservations driven by work order updates.
+
+Runs the app in-process against the in-memory mongomock-motor stand-in
+(startup is not run) and checks stock levels through the API.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+import turbo_server  # noqa: E402
+
+
+class ApiClient:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        transport = httpx.ASGITransport(app=turbo_server.app)
+        self.http = httpx.AsyncClient(transport=transport, base_url="http://test/api")
+
+    def request(self, method, url, **kwargs):
+        return self.loop.run_until_complete(self.http.request(method, url, **kwargs))
+
+    def close(self):
+        self.loop.run_until_complete(self.http.aclose())
+        self.loop.close()
+
+
+@pytest.fixture
+def api():
+    original_db = turbo_server.db
+    turbo_server.db = mongomock_motor.AsyncMongoMockClient()["turbo_inventory"]
+    client = ApiClient()
+    yield client
+    client.close()
+    turbo_server.db = original_db
+
+
+@pytest.fixture
+def client_id(api):
+    return api.request("POST", "/clients", json={"name": "Kiss Péter", "phone": "+36 30 111 2222"}).json()["id"]
+
+
+def create_part(api, code, quantity=None):
+    return api.request("POST", "/turbo-parts", json={
+        "category": "GEO", "part_code": code, "supplier": "Melett", "quantity": quantity
+    }).json()
+
+
+def create_order(api, client_id):
+    return api.request("POST", "/work-orders", json={"client_id": client_id, "turbo_code": "5490-970-0071"}).json()
+
+
+def select(api, order, *parts):
+    return api.request("PUT", f"/work-orders/{order['id']}", json={"parts": [
+        {
+            "part_id": part["id"], "part_code": part["part_code"], "category": part["category"],
+            "supplier": part["supplier"], "price": part["price"], "selected": True
+        }
+        for part in parts
+    ]})
+
+
+def set_status(api, order, status):
+    return api.request("PUT", f"/work-orders/{order['id']}", json={"status": status})
+
+
+def stock(api, part):
+    parts = api.request("GET", "/turbo-parts").json()
+    found = next(p for p in parts if p["id"] == part["id"])
+    return found["quantity"], found["reserved"], found["available"]
+
+
+def test_two_orders_cannot_oversell_a_part(api, client_id):
+    part = create_part(api, "GEO-1", quantity=1)
+    first, second = create_order(api, client_id), create_order(api, client_id)
+
+    assert select(api, first, part).status_code == 200
+    response = select(api, second, part)
+    assert response.status_code == 400
+    assert "GEO-1" in response.json()["detail"]
+    assert stock(api, part) == (1, 1, 0)
+
+
+def test_rejected_order_releases_its_parts(api, client_id):
+    part = create_part(api, "GEO-2", quantity=2)
+    order = create_order(api, client_id)
+    select(api, order, part)
+    assert stock(api, part) == (2, 1, 1)
+
+    response = set_status(api, order, "REJECTED")
+    assert response.json()["reserved_part_ids"] == []
+    assert stock(api, part) == (2, 0, 2)
+
+
+def test_delivered_order_consumes_its_parts(api, client_id):
+    part = create_part(api, "GEO-3", quantity=2)
+    order = create_order(api, client_id)
+    select(api, order, part)
+
+    response = set_status(api, order, "DELIVERED")
+    assert response.json()["reserved_part_ids"] == []
+    assert stock(api, part) == (1, 0, 1)
+
+
+def test_uncounted_part_is_reserved_once_stock_is_counted(api, client_id):
+    part = create_part(api, "GEO-4")
+    order = create_order(api, client_id)
+    assert select(api, order, part).json()["reserved_part_ids"] == []
+    assert stock(api, part) == (None, 0, None)
+
+    api.request("POST", f"/turbo-parts/{part['id']}/stock", json={"delta": 1})
+    response = set_status(api, order, "IN_PROGRESS")
+    assert response.json()["reserved_part_ids"] == [part["id"]]
+    assert stock(api, part) == (1, 1, 0)
+
+
+def test_deleted_part_does_not_block_the_order(api, client_id):
+    part = create_part(api, "GEO-5")
+    order = create_order(api, client_id)
+    select(api, order, part)
+    api.request("DELETE", f"/turbo-parts/{part['id']}")
+
+    for status in ("IN_PROGRESS", "DELIVERED"):
+        assert set_status(api, order, status).status_code == 200
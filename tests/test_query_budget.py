@@ -0,0 +1,269 @@
+"""Database round-trip budgets per API route.
+
+Runs the app in-process and counts the collection operations each request
+issues, so N+1 patterns fail here instead of in production. Uses the
+database at TEST_MONGO_URL when a mongod is reachable, otherwise the
+in-memory mongomock-motor stand-in; skipped when neither is available.
+
+Counts are taken at the Motor API level (one per ``find_one``,
+``aggregate``, ``bulk_write``, ...), which is one command per call except
+for ``getMore`` batches of large results. Startup is not run, so
+background work (tailing the invalidation bus, flushing the write-behind
+buffers) stays out of the counts; the invalidation events published on the
+request path are counted. The stand-in lacks ``$lookup`` with ``let`` and ``$trim``, hence
+the narrowed ``fields`` on list requests.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import pymongo
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+import turbo_server  # noqa: E402
+
+MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+LIST_FIELDS = "id,work_number,client_name,turbo_code,status,total_amount,created_at"
+
+# Collection methods that cost a round trip; cursor-returning ones are
+# counted when called, the command itself runs on the first fetch.
+COMMANDS = {
+    "find", "find_one", "aggregate", "count_documents", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "create_index",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+}
+
+
+def _mongo_available():
+    try:
+        pymongo.MongoClient(MONGO_URL, serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except pymongo.errors.PyMongoError:
+        return False
+
+
+IN_MEMORY = not _mongo_available()
+
+
+class CountingCollection:
+    def __init__(self, collection, counter: Counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in COMMANDS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter[f"{self._collection.name}.{name}"] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, db):
+        self._db = db
+        self.counter = Counter()
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self.counter)
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class BudgetClient:
+    """Calls the app on one event loop and reports the operations of each call"""
+
+    def __init__(self, db):
+        self.db = db
+        self.loop = asyncio.new_event_loop()
+        transport = httpx.ASGITransport(app=turbo_server.app)
+        self.http = httpx.AsyncClient(transport=transport, base_url="http://test")
+
+    def request(self, method, url, **kwargs):
+        self.db.counter.clear()
+        response = self.loop.run_until_complete(self.http.request(method, url, **kwargs))
+        assert response.status_code < 400, response.text
+        return response, Counter(self.db.counter)
+
+    def close(self):
+        self.loop.run_until_complete(self.http.aclose())
+        self.loop.close()
+
+
+@pytest.fixture(scope="module")
+def raw_db():
+    if not IN_MEMORY:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(MONGO_URL)
+        db_name = "turbo_budget_%s" % uuid.uuid4().hex[:8]
+        yield client[db_name]
+        pymongo.MongoClient(MONGO_URL).drop_database(db_name)
+        client.close()
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        yield mongomock_motor.AsyncMongoMockClient()["turbo_budget"]
+
+
+@pytest.fixture(scope="module")
+def api(raw_db):
+    original_db = turbo_server.db
+    turbo_server.db = CountingDatabase(raw_db)
+    # Publish cache invalidation events through the counted database, as the
+    # started bus would, without tailing them (no capped collection needed)
+    bus = turbo_server.invalidation_bus
+    bus._collection = turbo_server.db[bus.collection_name]
+    client = BudgetClient(turbo_server.db)
+    yield client
+    client.close()
+    bus._collection = None
+    turbo_server.db = original_db
+
+
+@pytest.fixture(scope="module")
+def seeded(api):
+    api.request("POST", "/api/initialize-data")
+    client, _ = api.request("POST", "/api/clients", json={"name": "Kiss Péter", "phone": "+36 30 111 2222"})
+    return {"client": client.json()}
+
+
+@pytest.fixture
+def work_order(api, seeded):
+    response, _ = api.request("POST", "/api/work-orders", json={
+        "client_id": seeded["client"]["id"],
+        "turbo_code": "5490-970-0071",
+    })
+    return response.json()
+
+
+def assert_budget(counts: Counter, total: int, **per_operation):
+    assert sum(counts.values()) <= total, dict(counts)
+    for name, limit in per_operation.items():
+        operation = name.replace("__", ".")
+        assert counts[operation] <= limit, dict(counts)
+
+
+def test_initialize_data_is_one_bulk_write_per_collection(api):
+    for _ in range(2):
+        _, counts = api.request("POST", "/api/initialize-data")
+        assert_budget(counts, 3)
+        assert set(counts) == {"car_makes.bulk_write", "work_processes.bulk_write", "turbo_parts.bulk_write"}
+
+
+def test_list_work_orders_is_one_aggregate_then_cached(api, work_order):
+    _, counts = api.request("GET", "/api/work-orders", params={"fields": LIST_FIELDS})
+    assert_budget(counts, 1, work_orders__aggregate=1)
+
+    _, counts = api.request("GET", "/api/work-orders", params={"fields": LIST_FIELDS})
+    assert_budget(counts, 0)
+
+
+def test_list_work_orders_filters_stay_one_aggregate(api, work_order):
+    for params in (
+        {"status": "RECEIVED"},
+        {"search": "5490"},
+        {"client_id": work_order["client_id"]},
+        {"received_from": work_order["received_date"], "due_to": "2099-12-31"},
+    ):
+        _, counts = api.request("GET", "/api/work-orders", params={**params, "fields": LIST_FIELDS})
+        assert_budget(counts, 1, work_orders__aggregate=1)
+
+
+def test_update_work_order_status(api, work_order):
+    _, counts = api.request("PUT", f"/api/work-orders/{work_order['id']}", json={"status": "IN_PROGRESS"})
+    # read, conditional write returning the new image, cache event; stats and rollups do not depend on the status
+    assert_budget(
+        counts, 3,
+        work_orders__find_one=1, work_orders__find_one_and_update=1, cache_invalidations__insert_one=1
+    )
+
+
+def test_update_work_order_prices(api, work_order):
+    _, counts = api.request("PUT", f"/api/work-orders/{work_order['id']}", json={
+        "turbo_code": "1234-567-0001",
+        "cleaning_price": 100.0,
+    })
+    # read, write, client stats and per-code counters (4), monthly rollups (1), cache event (1)
+    assert_budget(
+        counts, 8,
+        work_orders__find_one=1, work_orders__find_one_and_update=1,
+        monthly_rollups__bulk_write=1, cache_invalidations__insert_one=1
+    )
+
+
+def test_unchanged_work_order_revalidates_with_one_projected_read(api, work_order):
+    response, counts = api.request("GET", f"/api/work-orders/{work_order['id']}")
+    assert_budget(counts, 1)
+
+    etag = response.headers["etag"]
+    response, counts = api.request("GET", f"/api/work-orders/{work_order['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert_budget(counts, 1, work_orders__find_one=1)
+
+
+def test_create_work_order(api, seeded):
+    _, counts = api.request("POST", "/api/work-orders", json={
+        "client_id": seeded["client"]["id"],
+        "turbo_code": "5490-970-0071",
+    })
+    # client check, work number counter, insert, client stats and per-code counter (2),
+    # monthly rollups (1), one cache event for write versions and lookup indexes together
+    assert_budget(
+        counts, 7,
+        work_orders__insert_one=1, counters__find_one_and_update=1,
+        work_orders__aggregate=0, cache_invalidations__insert_one=1
+    )
+
+
+def test_create_client_is_one_insert_and_one_cache_event(api):
+    _, counts = api.request("POST", "/api/clients", json={"name": "Nagy Anna", "phone": "+36 20 333 4444"})
+    # plus the cache event invalidating cached work order lists
+    assert_budget(counts, 2, clients__insert_one=1, cache_invalidations__insert_one=1)
+
+
+def test_client_history(api, seeded, work_order):
+    client_id = seeded["client"]["id"]
+    api.request("GET", f"/api/clients/{client_id}/history")
+    _, counts = api.request("GET", f"/api/clients/{client_id}/history")
+    assert_budget(counts, 4)
+
+
+def test_catalog_lists_are_single_queries(api, seeded):
+    for url in ("/api/car-makes", "/api/turbo-parts", "/api/work-processes", "/api/clients"):
+        _, counts = api.request("GET", url)
+        assert_budget(counts, 1)
+
+
+def test_in_memory_lookups_do_not_touch_the_database(api, seeded):
+    for url, params in (
+        ("/api/turbo-codes/suggest", {"q": "54"}),
+        ("/api/notes/search", {"q": "olaj"}),
+        ("/api/compatibility/turbos/5490-970-0071", {}),
+    ):
+        _, counts = api.request("GET", url, params=params)
+        assert_budget(counts, 0)
+
+
+@pytest.mark.skipif(IN_MEMORY, reason="the in-memory stand-in does not support $unionWith")
+def test_board_is_one_aggregate_for_all_columns(api, work_order):
+    response, counts = api.request("GET", "/api/work-orders/board", params={"limit": 5})
+    assert len(response.json()["columns"]) == len(turbo_server.WorkStatus)
+    assert_budget(counts, 1, work_orders__aggregate=1)
+
+    _, counts = api.request("GET", "/api/work-orders/board/RECEIVED", params={"before": work_order["created_at"]})
+    assert_budget(counts, 1, work_orders__aggregate=1)
+
+
+def test_work_queues_are_one_aggregate(api, work_order):
+    for queue in ("overdue", "due_today", "this_week", "awaiting_quote"):
+        _, counts = api.request("GET", f"/api/work-orders/queues/{queue}", params={"fields": LIST_FIELDS})
+        assert_budget(counts, 1, work_orders__aggregate=1)
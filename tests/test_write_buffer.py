@@ -0,0 +1,67 @@
+"""Shutdown and failure handling of the write-behind buffer."""
+import asyncio
+import sys
+from pathlib import Path
+
+import pymongo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from write_buffer import WriteBehindBuffer  # noqa: E402
+
+
+class SlowCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_many(self, docs, ordered):
+        await asyncio.sleep(0.05)
+        self.docs.extend(docs)
+
+
+class FailingCollection:
+    async def insert_many(self, docs, ordered):
+        raise pymongo.errors.BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}], "nInserted": 2})
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def test_stop_completes_the_running_flush():
+    async def scenario():
+        collection, flushed = SlowCollection(), []
+
+        async def on_flush(batch):
+            flushed.extend(batch)
+
+        buffer = WriteBehindBuffer("entries", max_batch=2, on_flush=on_flush)
+        await buffer.start({"entries": collection})
+        for n in range(7):
+            buffer.append({"n": n})
+        await asyncio.sleep(0.01)  # Background flush is inside insert_many
+        await buffer.stop()
+        return collection, flushed, buffer
+
+    collection, flushed, buffer = run(scenario())
+    assert [doc["n"] for doc in collection.docs] == list(range(7))
+    assert len(flushed) == 7
+    assert buffer.written == 7 and buffer.dropped == 0
+
+
+def test_partial_failure_reports_only_inserted_documents():
+    async def scenario():
+        flushed = []
+
+        async def on_flush(batch):
+            flushed.extend(batch)
+
+        buffer = WriteBehindBuffer("entries", on_flush=on_flush)
+        buffer._collection = FailingCollection()
+        for n in range(3):
+            buffer.append({"n": n})
+        await buffer.flush()
+        return flushed, buffer
+
+    flushed, buffer = run(scenario())
+    assert [doc["n"] for doc in flushed] == [0, 2]
+    assert buffer.written == 2